@@ -7,47 +7,85 @@ from fastapi.middleware import Middleware
 from fastapi.middleware.gzip import GZipMiddleware
 
 from app.api.routes import router as api_router
+from app.api.routes.metrics import router as metrics_router
+from app.api.middlewares.metrics import MetricsMiddleware
 from app.api.middlewares.user_id import UserIDMiddleware
 from app.api.middlewares.kafka_logger import KafkaLoggerMiddleware
 from app.database import db_helper
 from app.config import settings
 from app.broker import app_broker
+from app.metrics import instrument_engine, instrument_broker
+from app.services.cargo.cache import invalidate_rates
+from app.services.cargo.handler import CargoTypeHandler, CargoRateHandler
+from app.services.cargo.jobs import rate_jobs
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # runs in every worker, after any fork: connections are opened here
+    if settings.metrics.enabled:
+        for engine in db_helper.engines:
+            instrument_engine(engine, pool_metrics=engine is db_helper.engine)
+
     await app_broker.connect()
+    await db_helper.listen(settings.cache.channel, invalidate_rates)
+    async with db_helper.sessionmaker() as session:
+        await CargoTypeHandler.warm(session)
+    await db_helper.warm_up(
+        settings.db.warmup_connections, *CargoRateHandler.warm_up_stmts()
+    )
+    await rate_jobs.start(db_helper.sessionmaker)
     yield
+    await rate_jobs.dispose()
     await db_helper.dispose()
     await app_broker.dispose()
 
 
-application = FastAPI(
-    title="Cargo Insurance API",
-    version="0.1.0",
-    description="Cargo Insurance API",
-    license_info={
-        "name": "MIT",
-        "url": "https://choosealicense.com/licenses/mit/",
-    },
-    contact={
-        "name": "Konstantin Grudnitskiy",
-        "email": "k.grudnitskiy@yandex.ru",
-    },
-    middleware=[
+def create_app() -> FastAPI:
+    middleware = [
         Middleware(GZipMiddleware, minimum_size=1000),
         Middleware(UserIDMiddleware),
         Middleware(KafkaLoggerMiddleware),
-    ],
-    default_response_class=ORJSONResponse,
-    lifespan=lifespan,
-)
-application.include_router(api_router)
+    ]
+    if settings.metrics.enabled:
+        # outermost, so timings cover every other middleware as well
+        middleware.insert(
+            0,
+            Middleware(
+                MetricsMiddleware,
+                server_timing=settings.metrics.server_timing,
+            ),
+        )
+
+    app = FastAPI(
+        title="Cargo Insurance API",
+        version="0.1.0",
+        description="Cargo Insurance API",
+        license_info={
+            "name": "MIT",
+            "url": "https://choosealicense.com/licenses/mit/",
+        },
+        contact={
+            "name": "Konstantin Grudnitskiy",
+            "email": "k.grudnitskiy@yandex.ru",
+        },
+        middleware=middleware,
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan,
+    )
+    app.include_router(api_router)
+
+    if settings.metrics.enabled:
+        instrument_broker(app_broker)
+        app.include_router(metrics_router)
+
+    return app
 
 
 if __name__ == "__main__":
     uvicorn.run(
-        app="app.api.http_server:application",
+        app="app.api.http_server:create_app",
+        factory=True,
         host=settings.api.host,
         port=settings.api.port,
         reload=True,
@@ -1,20 +1,36 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.broker import app_broker, KafkaMessage
 
 
-class KafkaLoggerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        if 200 <= response.status_code < 300:
-            if kafka_action := getattr(request.state, "kafka_action", None):
-                user_id = getattr(request.state, "user_id", None)
+class KafkaLoggerMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        # a 304 answered the request from the client's cache, log it too
+        if status_code is not None and (
+            200 <= status_code < 300 or status_code == 304
+        ):
+            state = scope.get("state", {})
+            if kafka_action := state.get("kafka_action"):
                 await app_broker.publish(
                     KafkaMessage(
-                        user_id=user_id,
+                        user_id=state.get("user_id"),
                         action=kafka_action,
                     )
                 )
-
-        return response
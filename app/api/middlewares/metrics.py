@@ -0,0 +1,53 @@
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.metrics import (
+    RequestTimings,
+    request_timings,
+    http_request_duration,
+    http_request_db_queries,
+    http_request_db_duration,
+    http_request_pool_wait,
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, server_timing: bool = True) -> None:
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(started=time.perf_counter())
+        token = request_timings.set(timings)
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    elapsed = time.perf_counter() - timings.started
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", timings.server_timing(elapsed)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_timings.reset(token)
+            elapsed = time.perf_counter() - timings.started
+
+            # route templates keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            method = scope["method"]
+            http_request_duration.observe(elapsed, method, route, status_code)
+            http_request_db_queries.observe(timings.db_queries, method, route)
+            http_request_db_duration.observe(timings.db, method, route)
+            http_request_pool_wait.observe(timings.pool, method, route)
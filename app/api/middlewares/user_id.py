@@ -1,8 +1,14 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 
-class UserIDMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request.state.user_id = request.headers.get("X-User-Id")
-        return await call_next(request)
+class UserIDMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            # backs `request.state` for everything further down the stack
+            state = scope.setdefault("state", {})
+            state["user_id"] = Headers(scope=scope).get("X-User-Id")
+        await self.app(scope, receive, send)
@@ -1,72 +1,265 @@
 from datetime import date
-from typing import Optional
+from typing import Literal, Optional
 
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Query, status, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from fastapi import (
+    APIRouter,
+    Query,
+    status,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+)
 
-from app.database import db_helper
+from app.config import settings
+from app.database import db_helper, READ_PRIMARY_COOKIE
 from app.services.cargo.schemas import (
+    MAX_PRICE,
     PostRatesSchema,
     CargoRate,
     DeleteRatesSchema,
+    InsuranceBatchSchema,
+    InsuranceItemOut,
+    ImportRatesResult,
+    RateChangesPage,
+    UpsertRatesResult,
+    RateUploadJobOut,
 )
 from app.services.cargo.handler import CargoRateHandler
+from app.services.cargo.jobs import RateUploadJobHandler, rate_jobs
+from app.services.cargo.parsers import PARSERS
+from app.services.cargo.export import FORMATS
 from app.utils.decorators import log_action
+from app.utils.http_cache import make_etag, cache_headers, is_not_modified
 
 router = APIRouter(prefix="/cargo", tags=["cargo"])
 
 
+def rate_cache_headers(rate_data, *extra) -> dict:
+    etag = make_etag(rate_data.id, rate_data.modified_at, *extra)
+    return cache_headers(
+        etag, rate_data.modified_at, settings.cache.http_max_age
+    )
+
+
 @router.get("/{cargo_type}/rates")
 async def get_rate(
     request: Request,
     cargo_type: str,
     dt: date = Query(..., default_factory=date.today),
-    session: AsyncSession = Depends(db_helper.get_session),
+    as_of: bool = False,
+    session: AsyncSession = Depends(db_helper.get_read_session),
 ) -> Optional[CargoRate]:
     request.state.kafka_action = f"get_{cargo_type}_rate"
-    rate_data = await CargoRateHandler.get_rate(session, cargo_type, dt)
+    rate_data = await CargoRateHandler.get_rate(session, cargo_type, dt, as_of)
     if not rate_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Rate not found for this date.",
         )
-    return rate_data
+
+    headers = rate_cache_headers(rate_data)
+    if is_not_modified(request, headers):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    # pre-encoded, the response model only documents the body
+    return Response(
+        CargoRateHandler.rate_json(rate_data),
+        media_type="application/json",
+        headers=headers,
+    )
 
 
 @router.get("/{cargo_type}/insurance")
 async def get_insurance(
     request: Request,
     cargo_type: str,
-    price: int,
+    price: int = Query(ge=0, le=MAX_PRICE),
     dt: date = Query(..., default_factory=date.today),
-    session: AsyncSession = Depends(db_helper.get_session),
+    as_of: bool = False,
+    session: AsyncSession = Depends(db_helper.get_read_session),
 ) -> float:
     request.state.kafka_action = f"get_{cargo_type}_insurance"
-    rate_data = await CargoRateHandler.get_rate(session, cargo_type, dt)
+    try:
+        rate_data, insurance = await CargoRateHandler.get_quote(
+            session, cargo_type, dt, price, as_of
+        )
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(exc),
+        )
     if not rate_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Rate not found for this date.",
         )
 
-    return float(f"{price * rate_data.rate:2f}")
+    headers = rate_cache_headers(rate_data, price)
+    if is_not_modified(request, headers):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    return Response(
+        orjson.dumps(insurance),
+        media_type="application/json",
+        headers=headers,
+    )
+
+
+@router.post("/insurance")
+@log_action(kafka_action="get_insurance_batch")
+async def get_insurance_batch(
+    request: Request,
+    data: InsuranceBatchSchema,
+    session: AsyncSession = Depends(db_helper.get_read_session),
+) -> list[InsuranceItemOut]:
+    return await CargoRateHandler.get_quotes(session, data.root)
+
+
+@router.get(
+    "/rates",
+    response_class=StreamingResponse,
+    responses={
+        status.HTTP_200_OK: {
+            "content": {media_type: {} for media_type, _ in FORMATS.values()}
+        }
+    },
+)
+async def export_rates(
+    request: Request,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cargo_type: list[str] = Query(default=[]),
+    format: Literal["ndjson", "csv"] = "ndjson",
+) -> StreamingResponse:
+    request.state.kafka_action = "export_rates"
+    media_type, encode = FORMATS[format]
+    primary = bool(request.cookies.get(READ_PRIMARY_COOKIE))
+
+    # the session has to outlive the route, so the stream owns it
+    async def content():
+        async with db_helper.read_session(primary=primary) as session:
+            batches = CargoRateHandler.iter_rates(
+                session, date_from, date_to, cargo_type
+            )
+            async for chunk in encode(batches):
+                yield chunk
+
+    return StreamingResponse(content(), media_type=media_type)
+
+
+@router.get("/rates/changes")
+async def get_rate_changes(
+    request: Request,
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    # a replica may lag behind the watermark, so the feed reads the primary
+    session: AsyncSession = Depends(db_helper.get_session),
+) -> RateChangesPage:
+    request.state.kafka_action = "get_rate_changes"
+    try:
+        return await CargoRateHandler.get_changes(session, since, limit)
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(exc),
+        )
 
 
 @router.post("/rates", status_code=status.HTTP_201_CREATED)
 @log_action
 async def post_rates(
     request: Request,
+    response: Response,
     data: PostRatesSchema,
     session: AsyncSession = Depends(db_helper.get_session),
-) -> None:
-    return await CargoRateHandler.post_rates(session, data)
+) -> UpsertRatesResult:
+    result = await CargoRateHandler.post_rates(session, data)
+    db_helper.stick_to_primary(response)
+    return result
+
+
+@router.post("/rates/jobs", status_code=status.HTTP_202_ACCEPTED)
+@log_action(kafka_action="post_rates_job")
+async def post_rates_job(
+    request: Request,
+    data: PostRatesSchema,
+    session: AsyncSession = Depends(db_helper.get_session),
+) -> RateUploadJobOut:
+    job = await RateUploadJobHandler.submit(session, data)
+    rate_jobs.notify()
+    return job
+
+
+@router.get("/rates/jobs/{job_id}")
+async def get_rates_job(
+    request: Request,
+    job_id: int,
+    session: AsyncSession = Depends(db_helper.get_session),
+) -> RateUploadJobOut:
+    request.state.kafka_action = "get_rates_job"
+    job = await RateUploadJobHandler.get_status(session, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found.",
+        )
+    return job
+
+
+@router.post(
+    "/rates/import",
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                content_type: {"schema": {"type": "string"}}
+                for content_type in PARSERS
+            },
+        }
+    },
+)
+@log_action(kafka_action="import_rates")
+async def import_rates(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(db_helper.get_session),
+) -> ImportRatesResult:
+    content_type = request.headers.get("Content-Type", "").split(";")[0]
+    parser = PARSERS.get(content_type.strip())
+    if parser is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Expected one of: {', '.join(PARSERS)}.",
+        )
+
+    try:
+        result = await CargoRateHandler.import_rates(
+            session, parser(request.stream())
+        )
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(exc),
+        )
+
+    db_helper.stick_to_primary(response)
+    return result
 
 
 @router.delete("/rates", status_code=status.HTTP_204_NO_CONTENT)
 @log_action(kafka_action="delete")
 async def delete_rates(
     request: Request,
+    response: Response,
     data: DeleteRatesSchema,
     session: AsyncSession = Depends(db_helper.get_session),
 ) -> None:
     await CargoRateHandler.delete_rates(session, data)
+    db_helper.stick_to_primary(response)
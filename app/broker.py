@@ -1,10 +1,19 @@
 import asyncio
+import logging
+import time
+from dataclasses import dataclass
 from datetime import datetime
+from enum import StrEnum
+from functools import partial
+from typing import Optional
 
 from aiokafka import AIOKafkaProducer
 from pydantic import BaseModel, Field
 
 from app.config import settings
+from app.utils.spool import Spool
+
+logger = logging.getLogger(__name__)
 
 
 class KafkaMessage(BaseModel):
@@ -13,6 +22,30 @@ class KafkaMessage(BaseModel):
     timestamp: datetime = Field(..., default_factory=datetime.now)
 
 
+class OverflowPolicy(StrEnum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    SPILL = "spill"
+
+
+@dataclass
+class BrokerStats:
+    queued: int = 0
+    sent: int = 0
+    dropped: int = 0
+    failed: int = 0
+    spilled: int = 0
+    replayed: int = 0
+    latency_sum: float = 0.0
+    latency_max: float = 0.0
+
+    def observe(self, latency: float) -> None:
+        self.sent += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+
+
 class AppBroker:
     def __init__(
         self,
@@ -20,17 +53,51 @@ class AppBroker:
         base_topic: str,
         linger_ms: int = 0,
         max_batch_size: int = 16384,
+        queue_maxsize: int = 0,
+        overflow_policy: str = OverflowPolicy.BLOCK,
+        max_in_flight: int = 1000,
+        batch_size: int = 100,
+        spool: Optional[Spool] = None,
+        spool_dir: Optional[str] = None,
+        spool_segment_size: int = 16 * 1024 * 1024,
+        spool_high_water: Optional[int] = None,
+        replay_interval: float = 5.0,
+        producer: Optional[AIOKafkaProducer] = None,
     ) -> None:
-        self.producer = None
+        self.producer = producer
         self.broker_url = broker_url
         self.linger_ms = linger_ms
         self.max_batch_size = max_batch_size
+        self.overflow_policy = OverflowPolicy(overflow_policy)
+        self.batch_size = batch_size
+
+        if self.overflow_policy is OverflowPolicy.SPILL and not (
+            spool or spool_dir
+        ):
+            raise ValueError("Overflow policy 'spill' requires a spool.")
+        self.spool = spool
+        # segments are named by pid, so the spool is opened in `connect`
+        self.spool_dir = spool_dir
+        self.spool_segment_size = spool_segment_size
+        self.spool_high_water = spool_high_water or queue_maxsize
+        self.replay_interval = replay_interval
 
         self.base_topic = base_topic
-        self.queue = asyncio.Queue()
+        self.queue: asyncio.Queue[tuple[float, bytes]] = asyncio.Queue(
+            maxsize=queue_maxsize
+        )
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.stats = BrokerStats()
         self.running = False
+        self.started = False
+        self.healthy = False
+        self.spilling = False
+        self.worker = None
+        self.replayer = None
 
     async def connect(self):
+        if self.spool is None and self.spool_dir:
+            self.spool = Spool(self.spool_dir, self.spool_segment_size)
         if self.producer is None:
             self.producer = AIOKafkaProducer(
                 bootstrap_servers=self.broker_url,
@@ -38,47 +105,178 @@ class AppBroker:
                 max_batch_size=self.max_batch_size,
             )
 
-        await self.producer.start()
+        try:
+            await self._start_producer()
+        except Exception:
+            # messages are kept in the queue or spool, see `_replay_worker`
+            logger.exception("Kafka is unavailable, will retry")
+
         self.running = True
-        asyncio.create_task(self._batch_worker())
+        self.worker = asyncio.create_task(self._batch_worker())
+        self.replayer = asyncio.create_task(self._replay_worker())
 
     async def dispose(self):
         self.running = False
-        if self.producer:
-            await self.producer.stop()
+        if self.replayer:
+            self.replayer.cancel()
+            self.replayer = None
+        if self.worker:
+            await self.worker
+            self.worker = None
+        try:
+            if self.producer and self.started:
+                # flushes every message still waiting in the accumulator
+                await self.producer.stop()
+                self.started = False
+                # let delivery callbacks of the final flush spill failures
+                await asyncio.sleep(0)
+        finally:
+            if self.spool:
+                self.spool.close()
 
     async def publish(self, message: KafkaMessage) -> None:
-        await self.queue.put(message.model_dump_json())
+        payload = message.model_dump_json().encode("utf-8")
+        if self._should_spill():
+            self._spill(payload)
+            return
+
+        item = (time.monotonic(), payload)
+        if self.overflow_policy is OverflowPolicy.BLOCK:
+            await self.queue.put(item)
+        else:
+            if self.queue.full():
+                self.stats.dropped += 1
+                if self.overflow_policy is OverflowPolicy.DROP_NEWEST:
+                    return
+                self.queue.get_nowait()
+            self.queue.put_nowait(item)
+        self.stats.queued += 1
+
+    def _should_spill(self) -> bool:
+        if self.spool is None:
+            return False
+        # once spilled, keep appending until replayed to preserve order
+        if self.spilling or not self.healthy:
+            return True
+        return (
+            self.overflow_policy is OverflowPolicy.SPILL
+            and self.queue.qsize() >= self.spool_high_water
+        )
+
+    def _spill(self, payload: bytes) -> None:
+        self.spool.append(payload)
+        self.spilling = True
+        self.stats.spilled += 1
+
+    async def _start_producer(self) -> None:
+        await self.producer.start()
+        self.started = True
+        self.healthy = True
 
     async def _batch_worker(self):
-        while self.running:
+        while self.running or not self.queue.empty():
+            if not self.started:
+                if not self.running:
+                    self._drain_to_spool()
+                    return
+                await asyncio.sleep(0.1)
+                continue
+
             messages = await self._collect_messages(
-                batch_size=100, timeout=0.1
+                batch_size=self.batch_size, timeout=0.1
             )
 
             if messages:
                 await self._send_messages(messages)
 
+    def _drain_to_spool(self) -> None:
+        while self.spool is not None and not self.queue.empty():
+            _, payload = self.queue.get_nowait()
+            self._spill(payload)
+
     async def _collect_messages(
         self, batch_size: int, timeout: float
-    ) -> list[str]:
-        messages = []
+    ) -> list[tuple[float, bytes]]:
         try:
-            while len(messages) < batch_size:
-                message = await asyncio.wait_for(
-                    self.queue.get(), timeout=timeout
-                )
-                messages.append(message)
+            messages = [
+                await asyncio.wait_for(self.queue.get(), timeout=timeout)
+            ]
         except asyncio.TimeoutError:
-            pass
+            return []
+
+        while len(messages) < batch_size and not self.queue.empty():
+            messages.append(self.queue.get_nowait())
         return messages
 
-    async def _send_messages(self, messages: list[str]) -> None:
-        tasks = [
-            self.producer.send_and_wait(self.base_topic, msg.encode("utf-8"))
-            for msg in messages
-        ]
-        await asyncio.gather(*tasks)
+    async def _send_messages(self, messages: list[tuple[float, bytes]]):
+        # the producer batches by itself (linger_ms / max_batch_size), so
+        # only enqueue here and account deliveries in the callback
+        for enqueued_at, payload in messages:
+            await self.in_flight.acquire()
+            try:
+                future = await self.producer.send(self.base_topic, payload)
+            except Exception:
+                logger.exception("Failed to enqueue message to Kafka")
+                self.in_flight.release()
+                self._on_failure(payload)
+                continue
+            future.add_done_callback(
+                partial(self._on_delivery, enqueued_at, payload)
+            )
+
+    def _on_delivery(
+        self, enqueued_at: float, payload: bytes, future: asyncio.Future
+    ):
+        self.in_flight.release()
+        if future.cancelled() or future.exception() is not None:
+            self._on_failure(payload)
+            return
+        self.stats.observe(time.monotonic() - enqueued_at)
+
+    def _on_failure(self, payload: bytes) -> None:
+        self.stats.failed += 1
+        self.healthy = False
+        if self.spool is not None:
+            self._spill(payload)
+
+    async def _replay_worker(self):
+        while self.running:
+            await asyncio.sleep(self.replay_interval)
+            if self.spool is not None:
+                self.spool.flush()
+
+            try:
+                if not self.started:
+                    await self._start_producer()
+                if self.spool is not None:
+                    await self._replay()
+            except Exception:
+                logger.warning("Kafka is unavailable, will retry")
+                self.healthy = False
+            else:
+                self.healthy = True
+
+    async def _replay(self) -> None:
+        while True:
+            self.spool.seal()
+            while (segment := self.spool.claim()) is not None:
+                records = self.spool.read(segment)
+                try:
+                    futures = [
+                        await self.producer.send(self.base_topic, record)
+                        for record in records
+                    ]
+                    await asyncio.gather(*futures)
+                except Exception:
+                    self.spool.release(segment)
+                    raise
+                self.spool.remove(segment)
+                self.stats.replayed += len(records)
+
+            # nothing was spilled while the last segments were in flight
+            if not self.spool.pending:
+                self.spilling = False
+                return
 
 
 app_broker = AppBroker(
@@ -86,4 +284,11 @@ app_broker = AppBroker(
     base_topic=settings.kafka.topic,
     linger_ms=settings.kafka.linger_ms,
     max_batch_size=settings.kafka.max_batch_size,
+    queue_maxsize=settings.kafka.queue_maxsize,
+    overflow_policy=settings.kafka.overflow_policy,
+    max_in_flight=settings.kafka.max_in_flight,
+    spool_dir=settings.kafka.spool_dir,
+    spool_segment_size=settings.kafka.spool_segment_size,
+    spool_high_water=settings.kafka.spool_high_water,
+    replay_interval=settings.kafka.replay_interval,
 )
@@ -0,0 +1,254 @@
+"""Maintenance of the yearly `cargo_rates` partitions and their tombstones.
+
+Create partitions for the coming years, moving matching rows out of the
+default partition (run it from cron well ahead of new year)::
+
+    python -m app.commands.partitions ensure --ahead 2
+
+Detach partitions of the years before `--before` into the `archive`
+schema, or drop them::
+
+    python -m app.commands.partitions archive --before 2020 [--drop]
+
+The change feed reports archived rates as deleted. Drop tombstones older
+than the feed's retention, a consumer further behind has to re-export::
+
+    python -m app.commands.partitions tombstones --keep-days 90
+
+Check that rate lookups and deletes only touch the partition of their
+date, exits non-zero otherwise::
+
+    python -m app.commands.partitions explain
+"""
+
+import argparse
+import asyncio
+import re
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import db_helper
+from app.models import CargoRate, CargoRateTombstone, CargoType
+from app.services.cargo.cache import notify_rates_changed
+from app.services.cargo.handler import CargoRateHandler
+
+PARENT = CargoRate.__tablename__
+DEFAULT = f"{PARENT}_default"
+ARCHIVE_SCHEMA = "archive"
+
+YEAR_RE = re.compile(rf"{PARENT}_y(\d{{4}})")
+PLAN_RE = re.compile(rf"\b{PARENT}_(?:y\d{{4}}|default)\b")
+
+
+def partition_name(year: int) -> str:
+    return f"{PARENT}_y{year}"
+
+
+async def get_partitions(session: AsyncSession) -> dict[int, str]:
+    result = await session.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass)"
+        ),
+        {"parent": PARENT},
+    )
+    return {
+        int(match[1]): match[0]
+        for match in map(YEAR_RE.fullmatch, result.scalars())
+        if match
+    }
+
+
+async def create_partition(session: AsyncSession, year: int) -> None:
+    name = partition_name(year)
+    bounds = {"lower": date(year, 1, 1), "upper": date(year + 1, 1, 1)}
+
+    # a new partition can't overlap rows already in the default one
+    await session.execute(
+        text(f"LOCK TABLE {DEFAULT} IN ACCESS EXCLUSIVE MODE")
+    )
+    await session.execute(
+        text(f"CREATE TEMPORARY TABLE moved (LIKE {PARENT}) ON COMMIT DROP")
+    )
+    await session.execute(
+        text(
+            f"WITH rows AS (DELETE FROM {DEFAULT} "
+            "WHERE dt >= :lower AND dt < :upper RETURNING *) "
+            "INSERT INTO moved SELECT * FROM rows"
+        ),
+        bounds,
+    )
+    await session.execute(
+        text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+        )
+    )
+    await session.execute(text(f"INSERT INTO {PARENT} SELECT * FROM moved"))
+    await session.commit()
+
+
+async def ensure(session: AsyncSession, ahead: int) -> list[str]:
+    partitions = await get_partitions(session)
+    stray = await session.scalars(
+        text(f"SELECT DISTINCT extract(year FROM dt)::int FROM {DEFAULT}")
+    )
+    this_year = date.today().year
+    years = {*range(this_year, this_year + ahead + 1), *stray}
+
+    created = []
+    for year in sorted(years - partitions.keys()):
+        await create_partition(session, year)
+        created.append(partition_name(year))
+    return created
+
+
+async def archive(
+    session: AsyncSession, before: int, drop: bool = False
+) -> list[str]:
+    partitions = await get_partitions(session)
+    archived = [name for year, name in partitions.items() if year < before]
+    if not archived:
+        return []
+
+    if not drop:
+        await session.execute(
+            text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        )
+    for name in archived:
+        # gone from the API, so gone from the change feed as well
+        await session.execute(
+            text(
+                f"INSERT INTO {CargoRateTombstone.__tablename__} "
+                f"(id, cargo_type_id, dt) SELECT id, cargo_type_id, dt "
+                f"FROM {name}"
+            )
+        )
+        await session.execute(
+            text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+        )
+        if drop:
+            await session.execute(text(f"DROP TABLE {name}"))
+        else:
+            await session.execute(
+                text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+            )
+
+    # archived rates disappear from the API, workers must drop them too
+    await notify_rates_changed(session)
+    await session.commit()
+    return archived
+
+
+async def prune_tombstones(session: AsyncSession, keep_days: int) -> int:
+    result = await session.execute(
+        delete(CargoRateTombstone).filter(
+            CargoRateTombstone.deleted_at
+            < func.now() - timedelta(days=keep_days)
+        )
+    )
+    await session.commit()
+    return result.rowcount
+
+
+def explain_stmts(dt: date) -> dict[str, tuple]:
+    """Statement and the number of partitions it may scan, by name."""
+    upsert = pg_insert(CargoRate).values(
+        cargo_type_id=0, dt=dt, rate=0, modified_at=func.now()
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[CargoRate.cargo_type_id, CargoRate.dt],
+        set_={"rate": upsert.excluded.rate},
+    )
+    return {
+        "get_rate": (
+            CargoRateHandler.rate_stmt(CargoRate.cargo_type_id == 0, dt),
+            1,
+        ),
+        "get_rate by name": (
+            CargoRateHandler.rate_stmt(CargoType.name == "", dt),
+            1,
+        ),
+        "get_rate as of": (
+            CargoRateHandler.rate_stmt(
+                CargoRate.cargo_type_id == 0, dt, as_of=True
+            ),
+            None,
+        ),
+        "post_rates": (upsert, None),
+        "delete_rates": (delete(CargoRate).filter(CargoRate.dt == dt), 1),
+        "delete_rates by type and dt": (
+            delete(CargoRate).filter(
+                CargoRate.dt == dt, CargoRate.cargo_type_id == 0
+            ),
+            1,
+        ),
+    }
+
+
+async def explain(session: AsyncSession, dt: date) -> bool:
+    ok = True
+    for title, (stmt, expected) in explain_stmts(dt).items():
+        sql = stmt.compile(
+            dialect=postgresql.dialect(),
+            compile_kwargs={"literal_binds": True},
+        )
+        plan = "\n".join(await session.scalars(text(f"EXPLAIN {sql}")))
+        scanned = sorted(set(PLAN_RE.findall(plan)))
+
+        pruned = expected is None or len(scanned) <= expected
+        ok &= pruned
+        print(f"-- {title}: {', '.join(scanned) or '-'}")
+        if not pruned:
+            print(plan)
+    return ok
+
+
+async def main(args: argparse.Namespace) -> int:
+    try:
+        async with db_helper.sessionmaker() as session:
+            if args.command == "ensure":
+                for name in await ensure(session, args.ahead):
+                    print(f"Created {name}")
+            elif args.command == "archive":
+                for name in await archive(session, args.before, args.drop):
+                    print(f"{'Dropped' if args.drop else 'Archived'} {name}")
+            elif args.command == "tombstones":
+                pruned = await prune_tombstones(session, args.keep_days)
+                print(f"Pruned {pruned} tombstones")
+            elif not await explain(session, args.dt):
+                return 1
+    finally:
+        await db_helper.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ensure_parser = commands.add_parser("ensure")
+    ensure_parser.add_argument("--ahead", type=int, default=1)
+
+    archive_parser = commands.add_parser("archive")
+    archive_parser.add_argument("--before", type=int, required=True)
+    archive_parser.add_argument("--drop", action="store_true")
+
+    tombstones_parser = commands.add_parser("tombstones")
+    tombstones_parser.add_argument("--keep-days", type=int, default=90)
+
+    explain_parser = commands.add_parser("explain")
+    explain_parser.add_argument(
+        "--dt", type=date.fromisoformat, default=date.today()
+    )
+
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,7 +1,15 @@
-from pydantic import BaseModel
+from typing import Any, Literal
+from uuid import uuid4
+
+from pydantic import BaseModel, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+def unique_statement_name() -> str:
+    # PgBouncer may hand each transaction to another server connection
+    return f"__asyncpg_{uuid4()}__"
+
+
 class ApiV1Config(BaseModel):
     prefix: str = "/v1"
 
@@ -22,9 +30,88 @@ class DatabaseConfig(BaseModel):
     host: str = "localhost"
     port: int = 5432
 
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_recycle: int = 1800
+    pool_timeout: float = 30
+    pool_pre_ping: bool = False
+    statement_cache_size: int = 100
+    prepared_statement_cache_size: int = 100
+    warmup_connections: int = 5
+
+    # read-only replicas as "host" or "host:port", same credentials
+    replicas: list[str] = []
+    replica_retry_after: float = 30
+    read_your_writes: float = 5
+    # after rates change every read goes to the primary this long, so a
+    # lagging replica can't put the old rates back into the cache
+    replica_max_lag: float = 5
+
+    # PgBouncer in transaction mode: no server-side prepared statement may
+    # outlive a transaction, and LISTEN needs a direct connection
+    pgbouncer: bool = False
+    direct_host: str | None = None
+    direct_port: int | None = None
+
+    @model_validator(mode="after")
+    def check_listen_host(self) -> "DatabaseConfig":
+        if self.pgbouncer and not self.direct_host:
+            raise ValueError(
+                "LISTEN gets no notifications through PgBouncer in "
+                "transaction mode, set direct_host to the database itself."
+            )
+        return self
+
+    def make_url(
+        self, host: str, port: int, driver: str = "postgresql+asyncpg"
+    ) -> str:
+        return (
+            f"{driver}://{self.user}:{self.password}"
+            f"@{host}:{port}/{self.name}"
+        )
+
     @property
     def url(self) -> str:
-        return f"postgresql+asyncpg://{self.user}:{self.password}@{self.host}:{self.port}/{self.name}"
+        return self.make_url(self.host, self.port)
+
+    @property
+    def replica_urls(self) -> list[str]:
+        urls = []
+        for replica in self.replicas:
+            host, _, port = replica.partition(":")
+            urls.append(self.make_url(host, int(port or self.port)))
+        return urls
+
+    @property
+    def listen_url(self) -> str:
+        return self.make_url(
+            self.direct_host or self.host,
+            self.direct_port or self.port,
+            driver="postgresql",
+        )
+
+    @property
+    def engine_options(self) -> dict[str, Any]:
+        cache_size = self.prepared_statement_cache_size
+        connect_args = {
+            "statement_cache_size": self.statement_cache_size,
+            "prepared_statement_cache_size": cache_size,
+        }
+        if self.pgbouncer:
+            connect_args = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": unique_statement_name,
+            }
+
+        return dict(
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_recycle=self.pool_recycle,
+            pool_timeout=self.pool_timeout,
+            pool_pre_ping=self.pool_pre_ping,
+            connect_args=connect_args,
+        )
 
 
 class KafkaConfig(BaseModel):
@@ -35,11 +122,54 @@ class KafkaConfig(BaseModel):
     linger_ms: int = 1000
     max_batch_size: int = 16384
 
+    queue_maxsize: int = 10000
+    overflow_policy: Literal[
+        "block", "drop_oldest", "drop_newest", "spill"
+    ] = "drop_oldest"
+    max_in_flight: int = 1000
+
+    spool_dir: str | None = None
+    spool_segment_size: int = 16 * 1024 * 1024
+    spool_high_water: int | None = None
+    replay_interval: float = 5.0
+
     @property
     def url(self) -> str:
         return f"{self.host}:{self.port}"
 
 
+class CacheConfig(BaseModel):
+    channel: str = "cargo_rates_changed"
+
+    rates_maxsize: int = 10000
+    rates_ttl: float = 300
+
+    # premiums by (cargo_type, dt, as_of, price), 0 disables
+    quotes_maxsize: int = 100000
+
+    # Cache-Control max-age of rate and insurance responses
+    http_max_age: int = 60
+
+    # the change feed stops before the oldest transaction still writing and
+    # holds back rows this fresh, for transactions yet to write their first
+    # row: modified_at is stamped at transaction start
+    changes_settle: float = 1.0
+
+
+class JobsConfig(BaseModel):
+    # concurrent rate-upload jobs per worker process
+    workers: int = 1
+    chunk_size: int = 5000
+    poll_interval: float = 5.0
+    # a running job not updated for this long is requeued
+    stale_after: float = 300
+
+
+class MetricsConfig(BaseModel):
+    enabled: bool = True
+    server_timing: bool = True
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=(".env.example", ".env"),
@@ -52,6 +182,9 @@ class Settings(BaseSettings):
     api: ApiConfig = ApiConfig()
     db: DatabaseConfig
     kafka: KafkaConfig = KafkaConfig()
+    cache: CacheConfig = CacheConfig()
+    jobs: JobsConfig = JobsConfig()
+    metrics: MetricsConfig = MetricsConfig()
 
 
 settings = Settings()
@@ -1,30 +1,290 @@
-from typing import AsyncGenerator
+import asyncio
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Optional,
+    Sequence,
+)
 
+import asyncpg
+from fastapi import Request, Response
+from sqlalchemy import Executable
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection
 from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
+    AsyncEngine,
     AsyncSession,
 )
 
 from app.config import settings
+from app.metrics import record_pool_wait
+
+logger = logging.getLogger(__name__)
+
+# set after a write so the client's next reads see it on the primary
+READ_PRIMARY_COOKIE = "read_primary"
+
+
+class TimedPool(AsyncAdaptedQueuePool):
+    """Reports time spent waiting for a connection to the request."""
+
+    def connect(self) -> PoolProxiedConnection:
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            record_pool_wait(time.perf_counter() - started)
+
+
+def make_sessionmaker(engine: AsyncEngine) -> async_sessionmaker:
+    return async_sessionmaker(
+        bind=engine,
+        autoflush=False,
+        autocommit=False,
+        expire_on_commit=False,
+    )
+
+
+@dataclass
+class Replica:
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker
+    down_until: float = 0.0
 
 
 class DatabaseHelper:
-    def __init__(self, db_url: str, **kw: dict):
-        self.engine = create_async_engine(db_url, **kw)
-        self.sessionmaker = async_sessionmaker(
-            bind=self.engine,
-            autoflush=False,
-            autocommit=False,
-            expire_on_commit=False,
-        )
+    def __init__(
+        self,
+        db_url: str,
+        listen_url: Optional[str] = None,
+        replica_urls: Sequence[str] = (),
+        replica_retry_after: float = 30.0,
+        read_your_writes: float = 0.0,
+        replica_max_lag: float = 0.0,
+        listen_retry_min: float = 0.5,
+        listen_retry_max: float = 30.0,
+        **kw: dict,
+    ):
+        kw.setdefault("poolclass", TimedPool)
+        self.db_url = db_url
+        self.replica_urls = list(replica_urls)
+        self.engine_options = kw
+        self.listen_url = listen_url
+        self.listeners: dict[str, asyncpg.Connection] = {}
+        self.listen_retry_min = listen_retry_min
+        self.listen_retry_max = listen_retry_max
+        self._relistening: dict[str, asyncio.Task] = {}
+        self.replica_retry_after = replica_retry_after
+        self.read_your_writes = read_your_writes
+        self.replica_max_lag = replica_max_lag
+        self.primary_until = 0.0
+        self._next_replica = itertools.count()
+
+        # engines are created on first use, in the process that uses them
+        self._engine: Optional[AsyncEngine] = None
+        self._sessionmaker: Optional[async_sessionmaker] = None
+        self._replicas: list[Replica] = []
+        os.register_at_fork(after_in_child=self._forget)
+
+    def _setup(self) -> None:
+        self._engine = create_async_engine(self.db_url, **self.engine_options)
+        self._sessionmaker = make_sessionmaker(self._engine)
+        self._replicas = []
+        for url in self.replica_urls:
+            engine = create_async_engine(url, **self.engine_options)
+            self._replicas.append(Replica(engine, make_sessionmaker(engine)))
+
+    def _forget(self) -> None:
+        # a forked child must not touch the parent's sockets, it opens its
+        # own connections on first use
+        for engine in self.engines if self._engine else ():
+            engine.sync_engine.dispose(close=False)
+        self._engine = None
+        self.listeners = {}
+        self._relistening = {}
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            self._setup()
+        return self._engine
+
+    @property
+    def sessionmaker(self) -> async_sessionmaker:
+        if self._engine is None:
+            self._setup()
+        return self._sessionmaker
+
+    @property
+    def replicas(self) -> list[Replica]:
+        if self._engine is None:
+            self._setup()
+        return self._replicas
+
+    @property
+    def engines(self) -> list[AsyncEngine]:
+        return [self.engine, *(replica.engine for replica in self.replicas)]
 
     async def get_session(self) -> AsyncGenerator[AsyncSession, None]:
         async with self.sessionmaker() as session:
             yield session
 
+    async def get_read_session(
+        self, request: Request
+    ) -> AsyncGenerator[AsyncSession, None]:
+        primary = bool(request.cookies.get(READ_PRIMARY_COOKIE))
+        async with self.read_session(primary=primary) as session:
+            yield session
+
+    @asynccontextmanager
+    async def read_session(
+        self, primary: bool = False
+    ) -> AsyncIterator[AsyncSession]:
+        """Read-only session on a healthy replica (round-robin), falling
+        back to the primary when none is available or `primary` is set,
+        e.g. because the client has just written something."""
+        replica = None if primary else self._pick_replica()
+
+        sessionmaker = replica.sessionmaker if replica else self.sessionmaker
+        async with sessionmaker() as session:
+            if replica is not None:
+                session.info["replica_picked_at"] = time.monotonic()
+            try:
+                yield session
+            except (InterfaceError, OperationalError, OSError):
+                # the connection is checked out lazily, so a dead replica
+                # only shows up here; keep other requests away from it
+                if replica is not None:
+                    logger.warning(
+                        "Replica %s is unavailable", replica.engine.url
+                    )
+                    replica.down_until = (
+                        time.monotonic() + self.replica_retry_after
+                    )
+                raise
+
+    def stick_to_primary(self, response: Response) -> None:
+        if self.replica_urls and self.read_your_writes:
+            response.set_cookie(
+                READ_PRIMARY_COOKIE,
+                "1",
+                max_age=int(self.read_your_writes),
+                httponly=True,
+            )
+
+    def hold_primary(self) -> None:
+        """Sends all reads to the primary for `replica_max_lag` seconds,
+        until replicas have replayed a write just committed."""
+        self.primary_until = time.monotonic() + self.replica_max_lag
+
+    def _pick_replica(self) -> Optional[Replica]:
+        if not self.replicas:
+            return None
+
+        now = time.monotonic()
+        if now < self.primary_until:
+            return None
+        start = next(self._next_replica) % len(self.replicas)
+        for replica in self.replicas[start:] + self.replicas[:start]:
+            if replica.down_until <= now:
+                return replica
+        return None
+
+    async def listen(self, channel: str, callback: Callable) -> None:
+        if channel in self.listeners:
+            return
+
+        url = self.listen_url or self.engine.url.set(
+            drivername="postgresql"
+        ).render_as_string(hide_password=False)
+        conn = await asyncpg.connect(url)
+        try:
+            await conn.add_listener(channel, callback)
+        except BaseException:
+            conn.terminate()
+            raise
+        conn.add_termination_listener(
+            lambda conn: self._listener_lost(conn, channel, callback)
+        )
+        self.listeners[channel] = conn
+
+    def _listener_lost(
+        self, conn: asyncpg.Connection, channel: str, callback: Callable
+    ) -> None:
+        # also called on close, only a connection still in use is lost
+        if self.listeners.get(channel) is not conn:
+            return
+
+        logger.warning("LISTEN connection for %s was lost", channel)
+        del self.listeners[channel]
+        # notifications sent meanwhile are gone, act as if one arrived
+        callback(conn, None, channel, "")
+        self._relistening[channel] = asyncio.create_task(
+            self._relisten(channel, callback)
+        )
+
+    async def _relisten(self, channel: str, callback: Callable) -> None:
+        delay = self.listen_retry_min
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.listen(channel, callback)
+            except Exception as exc:
+                # whatever it is, giving up would stop invalidation for good
+                logger.warning("LISTEN on %s failed: %r", channel, exc)
+                delay = min(delay * 2, self.listen_retry_max)
+                continue
+
+            # anything committed while nobody was listening
+            callback(self.listeners[channel], None, channel, "")
+            self._relistening.pop(channel, None)
+            return
+
+    async def warm_up(self, connections: int, *statements: Executable):
+        """Opens pooled connections up front and prepares `statements`
+        on each of them, so first requests skip connection setup."""
+
+        async def prepare(engine: AsyncEngine) -> None:
+            async with engine.connect() as conn:
+                for stmt in statements:
+                    await conn.execute(stmt)
+                await conn.rollback()
+
+        tasks = []
+        for engine in self.engines:
+            size = getattr(engine.pool, "size", None)
+            count = min(connections, size()) if size else connections
+            tasks.extend(prepare(engine) for _ in range(count))
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning("Connection warm-up failed: %r", result)
+
     async def dispose(self) -> None:
-        await self.engine.dispose()
+        for task in self._relistening.values():
+            task.cancel()
+        self._relistening = {}
+        listeners, self.listeners = self.listeners, {}
+        for conn in listeners.values():
+            await conn.close()
+        for engine in self.engines:
+            await engine.dispose()
 
 
-db_helper = DatabaseHelper(db_url=settings.db.url)
+db_helper = DatabaseHelper(
+    db_url=settings.db.url,
+    listen_url=settings.db.listen_url,
+    replica_urls=settings.db.replica_urls,
+    replica_retry_after=settings.db.replica_retry_after,
+    read_your_writes=settings.db.read_your_writes,
+    replica_max_lag=settings.db.replica_max_lag,
+    **settings.db.engine_options,
+)
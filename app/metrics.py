@@ -0,0 +1,230 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(34), chr(39))}"'
+        for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}" if pairs else ""
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self.series: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = ([0] * (len(self.buckets) + 1), [0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def render(self) -> Iterable[str]:
+        for values, (counts, total) in self.series.items():
+            cumulative = 0
+            for le, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                labels = _labels((*self.labels, "le"), (*values, le))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labels, values)
+            yield f"{self.name}_sum{labels} {total[0]}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge:
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Optional[float]],
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        value = self.collect()
+        if value is not None:
+            yield f"{self.name} {value}"
+
+
+class Counter(Gauge):
+    type = "counter"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Histogram | Gauge] = {}
+
+    def register(self, metric: Histogram | Gauge) -> Histogram | Gauge:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class RequestTimings:
+    started: float
+    db: float = 0.0
+    db_queries: int = 0
+    pool: float = 0.0
+
+    def server_timing(self, total: float) -> str:
+        app = max(total - self.db - self.pool, 0.0)
+        return (
+            f"pool;dur={self.pool * 1000:.2f}, "
+            f'db;dur={self.db * 1000:.2f};desc="{self.db_queries} queries", '
+            f"app;dur={app * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+registry = Registry()
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route.",
+        labels=("method", "route", "status"),
+    )
+)
+http_request_db_queries = registry.register(
+    Histogram(
+        "http_request_db_queries",
+        "SQL statements executed per HTTP request.",
+        labels=("method", "route"),
+        buckets=COUNT_BUCKETS,
+    )
+)
+http_request_db_duration = registry.register(
+    Histogram(
+        "http_request_db_duration_seconds",
+        "Time spent executing SQL per HTTP request.",
+        labels=("method", "route"),
+    )
+)
+http_request_pool_wait = registry.register(
+    Histogram(
+        "http_request_pool_wait_seconds",
+        "Time spent acquiring a database connection per HTTP request.",
+        labels=("method", "route"),
+    )
+)
+
+
+def record_pool_wait(seconds: float) -> None:
+    if timings := request_timings.get():
+        timings.pool += seconds
+
+
+def _before_cursor_execute(conn, *_):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, *_):
+    started = conn.info.pop("query_started", None)
+    timings = request_timings.get()
+    if started is not None and timings is not None:
+        timings.db += time.perf_counter() - started
+        timings.db_queries += 1
+
+
+def instrument_engine(engine: AsyncEngine, pool_metrics: bool = True):
+    """Accounts SQL executed within a request to its `RequestTimings`.
+    Safe to call again for the same engine."""
+    sync_engine = engine.sync_engine
+    for name, listener in (
+        ("before_cursor_execute", _before_cursor_execute),
+        ("after_cursor_execute", _after_cursor_execute),
+    ):
+        if not event.contains(sync_engine, name, listener):
+            event.listen(sync_engine, name, listener)
+
+    if not pool_metrics:
+        return
+
+    pool = sync_engine.pool
+    for name, method, help in (
+        ("db_pool_size", "size", "Configured connection pool size."),
+        ("db_pool_checked_out", "checkedout", "Connections in use."),
+        ("db_pool_checked_in", "checkedin", "Idle pooled connections."),
+        ("db_pool_overflow", "overflow", "Connections above pool size."),
+    ):
+        # not every pool class (e.g. NullPool) keeps these statistics
+        if collect := getattr(pool, method, None):
+            registry.register(Gauge(name, help, collect))
+
+
+def instrument_broker(broker) -> None:
+    stats = broker.stats
+    registry.register(
+        Gauge(
+            "broker_queue_depth",
+            "Audit events waiting in memory.",
+            broker.queue.qsize,
+        )
+    )
+    for name in ("queued", "sent", "dropped", "failed", "spilled", "replayed"):
+        registry.register(
+            Counter(
+                f"broker_messages_{name}_total",
+                f"Audit events {name}.",
+                lambda name=name: getattr(stats, name),
+            )
+        )
+    registry.register(
+        Counter(
+            "broker_delivery_latency_seconds_sum",
+            "Total publish-to-ack latency of delivered audit events.",
+            lambda: stats.latency_sum,
+        )
+    )
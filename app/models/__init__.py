@@ -1,2 +1,8 @@
 from .base import Base
-from .cargo import CargoRate, CargoType
+from .cargo import (
+    CargoRate,
+    CargoRateTombstone,
+    CargoType,
+    JobStatus,
+    RateUploadJob,
+)
@@ -1,7 +1,10 @@
 from datetime import date, datetime, UTC
+from enum import StrEnum
+from typing import Any, Optional
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import UniqueConstraint, ForeignKey, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import UniqueConstraint, ForeignKey, Index, func, text
 
 from .base import Base
 
@@ -17,21 +20,92 @@ class CargoType(Base):
 class CargoRate(Base):
     __tablename__ = "cargo_rates"
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
     rate: Mapped[float] = mapped_column()
-    dt: Mapped[date] = mapped_column()
+    # partition key, so it has to be part of the table's primary key
+    dt: Mapped[date] = mapped_column(primary_key=True)
     cargo_type_id: Mapped[int] = mapped_column(ForeignKey("cargo_types.id"))
     modified_at: Mapped[datetime] = mapped_column(
         default=datetime.now,
         server_default=func.now(),
-        onupdate=datetime.now(),
+        onupdate=func.now(),
         server_onupdate=func.now(),
     )
 
     cargo_type: Mapped[CargoType] = relationship()
 
-    __table_args__ = (UniqueConstraint("cargo_type_id", "dt"),)
+    __table_args__ = (
+        # also covers rate lookups, so they never touch the heap
+        UniqueConstraint(
+            "cargo_type_id",
+            "dt",
+            postgresql_include=["id", "rate", "modified_at"],
+        ),
+        Index("ix_cargo_rates_modified_at_id", "modified_at", "id"),
+        {"postgresql_partition_by": "RANGE (dt)"},
+    )
+    # ids are unique on their own, identity stays the plain id
+    __mapper_args__ = {"primary_key": [id]}
 
     def __repr__(self):
         return f"CargoRate(rate={self.rate}, dt={self.dt}, cargo_type_id={self.cargo_type_id})"
+
+
+class CargoRateTombstone(Base):
+    __tablename__ = "cargo_rate_tombstones"
+
+    # id of the deleted cargo rate
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+
+    dt: Mapped[date] = mapped_column()
+    cargo_type_id: Mapped[int] = mapped_column(ForeignKey("cargo_types.id"))
+    deleted_at: Mapped[datetime] = mapped_column(server_default=func.now())
+
+    cargo_type: Mapped[CargoType] = relationship()
+
+    __table_args__ = (
+        Index("ix_cargo_rate_tombstones_deleted_at_id", "deleted_at", "id"),
+    )
+
+
+class JobStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class RateUploadJob(Base):
+    __tablename__ = "rate_upload_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    status: Mapped[str] = mapped_column(
+        default=JobStatus.PENDING, server_default=JobStatus.PENDING
+    )
+    # [cargo_type, dt, rate] rows, deduplicated, processed in order
+    rates: Mapped[list[Any]] = mapped_column(JSONB)
+
+    total: Mapped[int] = mapped_column()
+    processed: Mapped[int] = mapped_column(default=0, server_default="0")
+    inserted: Mapped[int] = mapped_column(default=0, server_default="0")
+    updated: Mapped[int] = mapped_column(default=0, server_default="0")
+    unchanged: Mapped[int] = mapped_column(default=0, server_default="0")
+    error: Mapped[Optional[str]] = mapped_column()
+
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
+    # bumped with every chunk, a running job that stops moving is stale
+    updated_at: Mapped[datetime] = mapped_column(
+        server_default=func.now(), onupdate=func.now()
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_rate_upload_jobs_pending",
+            "id",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+    # server-side timestamps come back with RETURNING, no extra SELECT
+    __mapper_args__ = {"eager_defaults": True}
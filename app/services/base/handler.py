@@ -1,17 +1,53 @@
-from typing import TypeVar, Generic, Union, Optional, Iterable, Sequence, List
+from typing import (
+    AsyncIterator,
+    TypeVar,
+    Generic,
+    Union,
+    Optional,
+    Iterable,
+    Iterator,
+    Sequence,
+    List,
+    Tuple,
+)
 
-from sqlalchemy import select, delete
+from sqlalchemy import (
+    Select,
+    column,
+    delete,
+    insert,
+    inspect,
+    or_,
+    select,
+    tuple_,
+    update,
+    values,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.models import Base
+from app.utils.cursor import encode_cursor, decode_cursor
 
 M = TypeVar("M", bound=Base)
 
+# asyncpg (the Postgres wire protocol) caps bind parameters per statement
+MAX_BIND_PARAMS = 32767
+
 
 class BaseHandler(Generic[M]):
     model: M
 
+    @classmethod
+    def chunks(
+        cls, data: List, chunk_size: Optional[int] = None
+    ) -> Iterator[List]:
+        if not data:
+            return
+        size = chunk_size or max(1, MAX_BIND_PARAMS // len(data[0]))
+        for i in range(0, len(data), size):
+            yield data[i : i + size]
+
     @classmethod
     async def get(
         cls,
@@ -34,6 +70,43 @@ class BaseHandler(Generic[M]):
         result = await session.scalars(stmt)
         return result.one_or_none()
 
+    @classmethod
+    def sort_keys(cls, order_by: str, order_direction: str) -> tuple:
+        if order_direction not in ("asc", "desc"):
+            raise ValueError(f"Invalid order direction '{order_direction}'.")
+        mapper = inspect(cls.model)
+        if order_by not in mapper.columns:
+            raise ValueError(f"Cannot order by '{order_by}'.")
+
+        # the primary key breaks ties, so keys are unique and stable
+        return (
+            getattr(cls.model, order_by),
+            *(
+                getattr(cls.model, column.key)
+                for column in mapper.primary_key
+                if column.key != order_by
+            ),
+        )
+
+    @classmethod
+    def list_stmt(
+        cls,
+        filters: Iterable = tuple(),
+        order_by: str = "id",
+        order_direction: str = "asc",
+        **filter_by,
+    ) -> Select:
+        keys = cls.sort_keys(order_by, order_direction)
+        if order_direction == "desc":
+            keys = [key.desc() for key in keys]
+
+        return (
+            select(cls.model)
+            .filter(*filters)
+            .filter_by(**filter_by)
+            .order_by(*keys)
+        )
+
     @classmethod
     async def get_list(
         cls,
@@ -46,15 +119,8 @@ class BaseHandler(Generic[M]):
         only_stmt: bool = False,
         **filter_by,
     ) -> Sequence[M]:
-        order_by_column = getattr(cls.model, order_by, None)
-        if order_by_column and order_direction == "desc":
-            order_by_column = order_by_column.desc()
-
         stmt = (
-            select(cls.model)
-            .filter(*filters)
-            .filter_by(**filter_by)
-            .order_by(order_by_column)
+            cls.list_stmt(filters, order_by, order_direction, **filter_by)
             .limit(limit)
             .offset(offset)
         )
@@ -65,6 +131,62 @@ class BaseHandler(Generic[M]):
         result = await session.scalars(stmt)
         return result.all()
 
+    @classmethod
+    async def get_page(
+        cls,
+        session: AsyncSession,
+        filters: Iterable = tuple(),
+        order_by: str = "id",
+        order_direction: str = "asc",
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        **filter_by,
+    ) -> Tuple[Sequence[M], Optional[str]]:
+        # keyset pagination; the cursor is None on the last page
+        keys = cls.sort_keys(order_by, order_direction)
+        if any(key.nullable for key in keys):
+            raise ValueError(f"Cannot paginate by nullable '{order_by}'.")
+        stmt = cls.list_stmt(
+            filters, order_by, order_direction, **filter_by
+        ).limit(limit + 1)
+
+        if cursor:
+            after = decode_cursor(
+                cursor, *(key.type.python_type for key in keys)
+            )
+            if order_direction == "desc":
+                stmt = stmt.filter(tuple_(*keys) < tuple_(*after))
+            else:
+                stmt = stmt.filter(tuple_(*keys) > tuple_(*after))
+
+        objs = (await session.scalars(stmt)).all()
+        if len(objs) <= limit:
+            return objs, None
+
+        objs = objs[:limit]
+        return objs, encode_cursor(
+            *(getattr(objs[-1], key.key) for key in keys)
+        )
+
+    @classmethod
+    async def iter_list(
+        cls,
+        session: AsyncSession,
+        filters: Iterable = tuple(),
+        order_by: str = "id",
+        order_direction: str = "asc",
+        batch_size: int = 1000,
+        **filter_by,
+    ) -> AsyncIterator[Sequence[M]]:
+        stmt = cls.list_stmt(
+            filters, order_by, order_direction, **filter_by
+        ).execution_options(yield_per=batch_size)
+
+        # server-side cursor, at most `batch_size` objects in memory
+        result = await session.stream_scalars(stmt)
+        async for objs in result.partitions():
+            yield objs
+
     @classmethod
     async def create(cls, session: AsyncSession, **kw) -> M:
         obj: M = cls.model(**kw)
@@ -74,10 +196,22 @@ class BaseHandler(Generic[M]):
 
     @classmethod
     async def create_many(
-        cls, session: AsyncSession, data: List[dict]
+        cls,
+        session: AsyncSession,
+        data: List[dict],
+        chunk_size: Optional[int] = None,
+        returning: bool = True,
     ) -> List[M]:
-        objs = [cls.model(**kw) for kw in data]
-        session.add_all(objs)
+        stmt = insert(cls.model)
+        if returning:
+            stmt = stmt.returning(cls.model)
+
+        objs = []
+        for chunk in cls.chunks(data, chunk_size):
+            # executemany, batched by SQLAlchemy's "insertmanyvalues"
+            result = await session.execute(stmt, chunk)
+            if returning:
+                objs.extend(result.scalars())
         await session.commit()
         return objs
 
@@ -96,18 +230,44 @@ class BaseHandler(Generic[M]):
 
     @classmethod
     async def update_many(
-        cls, session: AsyncSession, data: List[dict]
-    ) -> List[M]:
-        objs = []
-        for kw in data:
-            obj = await session.get(cls.model, kw["pk"])
-            if obj:
-                for key, value in kw.items():
-                    setattr(obj, key, value)
-                objs.append(obj)
-        session.add_all(objs)
+        cls,
+        session: AsyncSession,
+        data: List[dict],
+        chunk_size: Optional[int] = None,
+    ) -> List:
+        """Rows are `{"pk": ..., <field>: <value>, ...}`, all with the same
+        fields. Returns the primary keys of the updated rows."""
+        if not data:
+            return []
+
+        fields = [key for key in data[0] if key != "pk"]
+        if any(kw.keys() != data[0].keys() for kw in data):
+            raise ValueError("All rows must update the same fields.")
+
+        pk = getattr(cls.model, inspect(cls.model).primary_key[0].key)
+        source = values(
+            column("pk", pk.type),
+            *(column(key, getattr(cls.model, key).type) for key in fields),
+            name="source",
+        )
+        rows = [(kw["pk"], *(kw[key] for key in fields)) for kw in data]
+
+        ids = []
+        for chunk in cls.chunks(rows, chunk_size):
+            chunk_source = source.data(chunk)
+            # UPDATE ... FROM (VALUES ...) RETURNING, one statement a chunk
+            stmt = (
+                update(cls.model)
+                .where(pk == chunk_source.c.pk)
+                .values({key: chunk_source.c[key] for key in fields})
+                .returning(pk)
+            )
+            result = await session.execute(
+                stmt, execution_options={"synchronize_session": False}
+            )
+            ids.extend(result.scalars())
         await session.commit()
-        return objs
+        return ids
 
     @classmethod
     async def delete(
@@ -153,19 +313,52 @@ class BaseHandler(Generic[M]):
 
     @classmethod
     async def upsert_many(
-        cls, session: AsyncSession, pk_fields: Sequence[str], data: List[dict]
-    ) -> None:
-        stmt = (
-            pg_insert(cls.model)
-            .values(data)
-            .on_conflict_do_update(
-                index_elements=[getattr(cls.model, f) for f in pk_fields],
-                set_={
-                    key: pg_insert(cls.model).excluded[key]
-                    for key in data[0]
-                    if key not in pk_fields
-                },
+        cls,
+        session: AsyncSession,
+        pk_fields: Sequence[str],
+        data: List[dict],
+        chunk_size: Optional[int] = None,
+        executemany: bool = False,
+        returning: Sequence = (),
+        compare: Sequence[str] = (),
+        commit: bool = True,
+    ) -> List:
+        if not data:
+            return []
+
+        stmt = pg_insert(cls.model)
+
+        # leave a conflicting row alone unless a `compare` field differs
+        changed = None
+        if compare:
+            changed = or_(
+                *(
+                    getattr(cls.model, f).is_distinct_from(stmt.excluded[f])
+                    for f in compare
+                )
             )
+
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(cls.model, f) for f in pk_fields],
+            set_={
+                key: stmt.excluded[key]
+                for key in data[0]
+                if key not in pk_fields
+            },
+            where=changed,
         )
-        await session.execute(stmt)
-        await session.commit()
+        if returning:
+            stmt = stmt.returning(*returning)
+
+        rows = []
+        for chunk in cls.chunks(data, chunk_size):
+            if executemany:
+                result = await session.execute(stmt, chunk)
+            else:
+                result = await session.execute(stmt.values(chunk))
+            if returning:
+                rows.extend(result.all())
+        # left to the caller, e.g. to write more in the same transaction
+        if commit:
+            await session.commit()
+        return rows
@@ -0,0 +1,42 @@
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import db_helper
+from app.utils.cache import LRUCache
+
+rates_cache = LRUCache(
+    maxsize=settings.cache.rates_maxsize,
+    ttl=settings.cache.rates_ttl,
+)
+
+quotes_cache = LRUCache(
+    maxsize=settings.cache.quotes_maxsize,
+    ttl=settings.cache.rates_ttl,
+)
+
+# encoded JSON bodies of rate responses, by (rate id, modified_at)
+bodies_cache = LRUCache(
+    maxsize=settings.cache.rates_maxsize,
+    ttl=settings.cache.rates_ttl,
+)
+
+
+def invalidate_rates(*_) -> None:
+    rates_cache.clear()
+    quotes_cache.clear()
+    bodies_cache.clear()
+    # misses must not refill the caches from a replica behind the write
+    db_helper.hold_primary()
+
+
+def is_cacheable(session: AsyncSession) -> bool:
+    """False for a replica session picked before the last invalidation,
+    its reads may predate the write that caused it."""
+    picked_at = session.info.get("replica_picked_at")
+    return picked_at is None or picked_at > rates_cache.cleared_at
+
+
+async def notify_rates_changed(session: AsyncSession) -> None:
+    # delivered to every listening worker once the transaction commits
+    await session.execute(select(func.pg_notify(settings.cache.channel, "")))
@@ -0,0 +1,42 @@
+import csv
+import io
+from typing import AsyncIterable, AsyncIterator, Sequence
+
+import orjson
+from sqlalchemy import Row
+
+COLUMNS = ("cargo_type", "dt", "rate", "modified_at")
+
+
+async def to_ndjson(
+    batches: AsyncIterable[Sequence[Row]],
+) -> AsyncIterator[bytes]:
+    async for rows in batches:
+        yield b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+
+
+async def to_csv(
+    batches: AsyncIterable[Sequence[Row]],
+) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    # sent up front, so an export without rows is still a valid CSV
+    yield buffer.getvalue().encode("utf-8")
+    buffer.seek(0)
+    buffer.truncate()
+
+    async for rows in batches:
+        writer.writerows(
+            (row.cargo_type, row.dt, row.rate, row.modified_at.isoformat())
+            for row in rows
+        )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", to_ndjson),
+    "csv": ("text/csv", to_csv),
+}
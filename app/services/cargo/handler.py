@@ -1,89 +1,582 @@
-from datetime import date, datetime
+import time
+from datetime import date, datetime, timedelta
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional, Sequence
 
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from sqlalchemy import delete
+from sqlalchemy.orm import contains_eager, load_only
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Float,
+    Identity,
+    MetaData,
+    Row,
+    Select,
+    String,
+    Table,
+    cast,
+    column,
+    delete,
+    false,
+    func,
+    insert,
+    literal_column,
+    null,
+    select,
+    table,
+    true,
+    tuple_,
+    union_all,
+)
 
-from app.models import CargoRate, CargoType
+from app.config import settings
+from app.models import CargoRate, CargoRateTombstone, CargoType
+from app.utils.cache import MISSING
+from app.utils.cursor import encode_cursor, decode_cursor
 from app.services.base.handler import BaseHandler
-from app.services.cargo.schemas import PostRatesSchema, DeleteRatesSchema
+from app.services.cargo.cache import (
+    rates_cache,
+    quotes_cache,
+    bodies_cache,
+    invalidate_rates,
+    is_cacheable,
+    notify_rates_changed,
+)
+from app.services.cargo.parsers import RateRow
+from app.services.cargo.pricing import premium
+from app.services.cargo.schemas import (
+    PostRatesSchema,
+    DeleteRatesSchema,
+    ImportRatesResult,
+    InsuranceItemIn,
+    InsuranceItemOut,
+    RateChange,
+    RateChangesPage,
+    UpsertRatesResult,
+)
+
+# on a RETURNING row, true if the upsert inserted rather than updated it
+INSERTED = literal_column("xmax = 0", Boolean).label("inserted")
+
+rates_import_table = Table(
+    "cargo_rates_import",
+    MetaData(),
+    Column("n", BigInteger, Identity()),
+    Column("cargo_type", String, nullable=False),
+    Column("dt", Date, nullable=False),
+    Column("rate", Float, nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+pg_stat_activity = table(
+    "pg_stat_activity",
+    column("datname"),
+    column("backend_xid"),
+    column("xact_start"),
+)
 
 
 class CargoTypeHandler(BaseHandler[CargoType]):
     model = CargoType
 
+    # cargo types are never renamed or deleted, so name -> id never goes
+    # stale; the dict is replaced as a whole, never mutated in place
+    ids: dict[str, int] = {}
+
+    @classmethod
+    async def warm(cls, session: AsyncSession) -> None:
+        result = await session.execute(select(CargoType.name, CargoType.id))
+        cls.ids = dict(result.all())
+
+    @classmethod
+    async def get_id(cls, session: AsyncSession, name: str) -> Optional[int]:
+        type_id = cls.ids.get(name)
+        if type_id is None:
+            type_id = await session.scalar(
+                select(CargoType.id).filter_by(name=name)
+            )
+            if type_id is not None:
+                cls.ids = {**cls.ids, name: type_id}
+        return type_id
+
+    @classmethod
+    async def ensure_ids(
+        cls, session: AsyncSession, names: Iterable[str]
+    ) -> dict[str, int]:
+        names = set(names)
+        missing = names - cls.ids.keys()
+        if missing:
+            # a fixed order, so concurrent uploads can't deadlock on it
+            result = await session.execute(
+                pg_insert(CargoType)
+                .values([{"name": name} for name in sorted(missing)])
+                .on_conflict_do_nothing()
+                .returning(CargoType.name, CargoType.id)
+            )
+            found = dict(result.all())
+
+            # created meanwhile by a concurrent upload
+            if rest := missing - found.keys():
+                result = await session.execute(
+                    select(CargoType.name, CargoType.id).filter(
+                        CargoType.name.in_(rest)
+                    )
+                )
+                found.update(result.all())
+
+            # committed before caching so a rollback can't leave bad ids
+            await session.commit()
+            cls.ids = {**cls.ids, **found}
+
+        return {name: cls.ids[name] for name in names}
+
 
 class CargoRateHandler(BaseHandler[CargoRate]):
     model = CargoRate
 
+    @classmethod
+    def rates_stmt(cls, *filters) -> Select:
+        # served by the covering (cargo_type_id, dt) unique index alone
+        return (
+            select(CargoRate)
+            .join(CargoRate.cargo_type)
+            .filter(*filters)
+            .options(
+                contains_eager(CargoRate.cargo_type),
+                load_only(
+                    CargoRate.rate,
+                    CargoRate.dt,
+                    CargoRate.cargo_type_id,
+                    CargoRate.modified_at,
+                ),
+            )
+        )
+
+    @classmethod
+    def rate_stmt(cls, type_filter, dt: date, as_of: bool = False) -> Select:
+        if as_of:
+            # the latest rate in effect on `dt`, a backward index scan
+            return (
+                cls.rates_stmt(type_filter, CargoRate.dt <= dt)
+                .order_by(CargoRate.dt.desc())
+                .limit(1)
+            )
+        return cls.rates_stmt(type_filter, CargoRate.dt == dt)
+
+    @classmethod
+    def warm_up_stmts(cls) -> list[Select]:
+        """The hot `get_rate` statements, for `DatabaseHelper.warm_up`."""
+        return [
+            cls.rate_stmt(CargoRate.cargo_type_id == 0, date.today(), as_of)
+            for as_of in (False, True)
+        ]
+
     @classmethod
     async def get_rate(
-        cls, session: AsyncSession, cargo_type: str, dt: date
+        cls,
+        session: AsyncSession,
+        cargo_type: str,
+        dt: date,
+        as_of: bool = False,
     ) -> CargoRate:
-        type_stmt = await CargoTypeHandler.get_by(
-            session, name=cargo_type, only_stmt=True
+        key = (cargo_type, dt, as_of)
+        rate = rates_cache.get(key, MISSING)
+        if rate is not MISSING:
+            return rate
+
+        version = rates_cache.version
+        if (type_id := CargoTypeHandler.ids.get(cargo_type)) is not None:
+            type_filter = CargoRate.cargo_type_id == type_id
+        else:
+            type_filter = CargoType.name == cargo_type
+
+        result = await session.scalars(cls.rate_stmt(type_filter, dt, as_of))
+        rate = result.one_or_none()
+        if is_cacheable(session):
+            rates_cache.set(key, rate, version=version)
+        return rate
+
+    @classmethod
+    async def get_rates(
+        cls, session: AsyncSession, keys: Iterable[tuple[str, date]]
+    ) -> dict[tuple[str, date], CargoRate | None]:
+        rates = {}
+        missing = set()
+        for key in keys:
+            rate = rates_cache.get((*key, False), MISSING)
+            if rate is MISSING:
+                missing.add(key)
+            else:
+                rates[key] = rate
+
+        if not missing:
+            return rates
+
+        version = rates_cache.version
+        stmt = cls.rates_stmt(
+            tuple_(CargoType.name, CargoRate.dt).in_(missing)
         )
+        found = {
+            (rate.cargo_type.name, rate.dt): rate
+            for rate in await session.scalars(stmt)
+        }
+        cacheable = is_cacheable(session)
+        for key in missing:
+            rates[key] = found.get(key)
+            if cacheable:
+                rates_cache.set((*key, False), rates[key], version=version)
 
-        rates_stmt = await cls.get_by(
-            session,
-            filters=(
-                CargoRate.cargo_type_id.in_(
-                    type_stmt.with_only_columns(CargoType.id)
-                ),
+        return rates
+
+    @classmethod
+    def rate_json(cls, rate: CargoRate) -> bytes:
+        """`rate` encoded as the `CargoRate` schema, without validating it
+        through the schema on every request."""
+        key = (rate.id, rate.modified_at)
+        body = bodies_cache.get(key)
+        if body is None:
+            body = orjson.dumps(
+                {
+                    "cargo_type": {
+                        "id": rate.cargo_type.id,
+                        "name": rate.cargo_type.name,
+                    },
+                    "rate": rate.rate,
+                    "dt": rate.dt,
+                }
+            )
+            bodies_cache.set(key, body)
+        return body
+
+    @classmethod
+    def quote(
+        cls,
+        key: tuple,
+        price: int,
+        rate: CargoRate,
+        version: int,
+        cacheable: bool = True,
+    ) -> float:
+        insurance = quotes_cache.get(key)
+        if insurance is None:
+            insurance = premium(price, rate.rate)
+            if cacheable:
+                quotes_cache.set(key, insurance, version=version)
+        return insurance
+
+    @classmethod
+    async def get_quote(
+        cls,
+        session: AsyncSession,
+        cargo_type: str,
+        dt: date,
+        price: int,
+        as_of: bool = False,
+    ) -> tuple[Optional[CargoRate], Optional[float]]:
+        # taken before the rate is read, like the rates cache does
+        version = quotes_cache.version
+        rate = await cls.get_rate(session, cargo_type, dt, as_of)
+        if rate is None:
+            return None, None
+        key = (cargo_type, dt, as_of, price)
+        return rate, cls.quote(
+            key, price, rate, version, is_cacheable(session)
+        )
+
+    @classmethod
+    async def get_quotes(
+        cls, session: AsyncSession, items: Sequence[InsuranceItemIn]
+    ) -> list[InsuranceItemOut]:
+        version = quotes_cache.version
+        rates = await cls.get_rates(
+            session, {(item.cargo_type, item.dt) for item in items}
+        )
+
+        cacheable = is_cacheable(session)
+        quotes = []
+        for item in items:
+            rate = rates.get((item.cargo_type, item.dt))
+            if rate is None:
+                quotes.append(
+                    InsuranceItemOut(error="Rate not found for this date.")
+                )
+                continue
+            key = (item.cargo_type, item.dt, False, item.price)
+            try:
+                insurance = cls.quote(
+                    key, item.price, rate, version, cacheable
+                )
+            except ValueError as exc:
+                quotes.append(InsuranceItemOut(error=str(exc)))
+            else:
+                quotes.append(InsuranceItemOut(insurance=insurance))
+        return quotes
+
+    @classmethod
+    async def iter_rates(
+        cls,
+        session: AsyncSession,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        cargo_types: Sequence[str] = (),
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Sequence[Row]]:
+        filters = []
+        if date_from:
+            filters.append(CargoRate.dt >= date_from)
+        if date_to:
+            filters.append(CargoRate.dt <= date_to)
+        if cargo_types:
+            filters.append(CargoType.name.in_(cargo_types))
+
+        # (cargo_type_id, dt) order follows the index, so nothing is sorted
+        stmt = (
+            select(
+                CargoType.name.label("cargo_type"),
+                CargoRate.dt,
+                CargoRate.rate,
+                CargoRate.modified_at,
+            )
+            .join(CargoRate.cargo_type)
+            .filter(*filters)
+            .order_by(CargoRate.cargo_type_id, CargoRate.dt)
+            .execution_options(yield_per=batch_size)
+        )
+
+        # server-side cursor, at most `batch_size` rows in memory
+        result = await session.stream(stmt)
+        async for rows in result.partitions():
+            yield rows
+
+    @classmethod
+    async def get_changes(
+        cls, session: AsyncSession, since: Optional[str], limit: int
+    ) -> RateChangesPage:
+        after = decode_cursor(since, datetime, int) if since else None
+        # its own statement, so the feed's snapshot is taken after it
+        settled = await cls.changes_watermark(session)
+
+        # each branch walks its (timestamp, id) index and stops at `limit`
+        branches = []
+        for deleted, model, modified_at, rate in (
+            (false(), CargoRate, CargoRate.modified_at, CargoRate.rate),
+            (
+                true(),
+                CargoRateTombstone,
+                CargoRateTombstone.deleted_at,
+                null(),
             ),
-            dt=dt,
-            only_stmt=True,
+        ):
+            stmt = (
+                select(
+                    model.id,
+                    CargoType.name.label("cargo_type"),
+                    model.dt,
+                    rate.label("rate"),
+                    deleted.label("deleted"),
+                    modified_at.label("modified_at"),
+                )
+                .join(model.cargo_type)
+                .filter(modified_at < settled)
+                .order_by(modified_at, model.id)
+                .limit(limit + 1)
+            )
+            if after:
+                stmt = stmt.filter(
+                    tuple_(modified_at, model.id) > tuple_(*after)
+                )
+            branches.append(stmt.subquery().select())
+
+        feed = union_all(*branches).subquery()
+        stmt = (
+            select(feed)
+            .order_by(feed.c.modified_at, feed.c.id)
+            .limit(limit + 1)
         )
-        stmt = rates_stmt.options(selectinload(CargoRate.cargo_type))
+        rows = (await session.execute(stmt)).all()
 
-        result = await session.scalars(stmt)
-        return result.one_or_none()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            since = encode_cursor(rows[-1].modified_at, rows[-1].id)
+
+        return RateChangesPage(
+            changes=[
+                RateChange.model_validate(row, from_attributes=True)
+                for row in rows
+            ],
+            cursor=since,
+            has_more=has_more,
+        )
+
+    @classmethod
+    async def changes_watermark(cls, session: AsyncSession) -> datetime:
+        """Everything modified before this is committed. `modified_at` is
+        the writer's transaction start, so a transaction still writing
+        can commit rows stamped long before now, e.g. a long import."""
+        writing = (
+            select(func.min(pg_stat_activity.c.xact_start))
+            .filter(
+                pg_stat_activity.c.datname == func.current_database(),
+                pg_stat_activity.c.backend_xid.is_not(None),
+            )
+            .scalar_subquery()
+        )
+        # a transaction that hasn't written yet has no xid to show up with
+        fresh = func.now() - timedelta(seconds=settings.cache.changes_settle)
+        return await session.scalar(
+            select(cast(func.least(writing, fresh), DateTime))
+        )
+
+    @classmethod
+    def latest_rates(
+        cls, data: PostRatesSchema
+    ) -> dict[tuple[str, date], float]:
+        # the last rate wins when a (cargo_type, dt) pair repeats
+        latest = {}
+        for dt, cargo_rates in data.root.items():
+            for cargo_rate in cargo_rates:
+                latest[cargo_rate.cargo_type, dt] = cargo_rate.rate
+        return latest
 
     @classmethod
     async def post_rates(
         cls,
         session: AsyncSession,
         data: PostRatesSchema,
-    ) -> None:
+    ) -> UpsertRatesResult:
+        return await cls.upsert_rates(session, cls.latest_rates(data))
 
-        objects = list()
-        cargo_types = set()
-        for dt, cargo_rates in data.root.items():
-            for cargo_rate in cargo_rates:
-                cargo_types.add(cargo_rate.cargo_type)
-                objects.append(
-                    dict(
-                        dt=dt,
-                        cargo_type=cargo_rate.cargo_type,
-                        rate=cargo_rate.rate,
-                        modified_at=datetime.now(),
-                    )
-                )
+    @classmethod
+    async def upsert_rates(
+        cls,
+        session: AsyncSession,
+        latest: dict[tuple[str, date], float],
+    ) -> UpsertRatesResult:
+        cargo_types = await CargoTypeHandler.ensure_ids(
+            session, {cargo_type for cargo_type, _ in latest}
+        )
+        objects = [
+            dict(
+                cargo_type_id=cargo_types[cargo_type],
+                dt=dt,
+                rate=rate,
+                # database clock, same as the change feed's
+                modified_at=func.now(),
+            )
+            for (cargo_type, dt), rate in latest.items()
+        ]
+
+        # unchanged rates aren't rewritten and come back without a row
+        rows = await cls.upsert_many(
+            session,
+            ("cargo_type_id", "dt"),
+            objects,
+            returning=(INSERTED,),
+            compare=("rate",),
+            commit=False,
+        )
+        # the NOTIFY commits together with the rates, or not at all
+        if rows:
+            await notify_rates_changed(session)
+        await session.commit()
+        if rows:
+            invalidate_rates()
+
+        inserted = sum(row.inserted for row in rows)
+        return UpsertRatesResult(
+            inserted=inserted,
+            updated=len(rows) - inserted,
+            unchanged=len(objects) - len(rows),
+        )
+
+    @classmethod
+    async def import_rates(
+        cls, session: AsyncSession, rows: AsyncIterable[RateRow]
+    ) -> ImportRatesResult:
+        started = time.perf_counter()
+        staging = rates_import_table
+
+        # also opens the transaction the raw COPY below runs in
+        await session.execute(CreateTable(staging))
+        conn = await (await session.connection()).get_raw_connection()
+        status = await conn.driver_connection.copy_records_to_table(
+            staging.name,
+            records=rows,
+            columns=("cargo_type", "dt", "rate"),
+        )
 
-        cargo_types_stmt = await CargoTypeHandler.get_list(
-            session=session,
-            filters=(CargoType.name.in_(cargo_types),),
-            only_stmt=True,
-        )
-
-        cargo_types_result = (await session.scalars(cargo_types_stmt)).all()
-        if len(cargo_types_result) != len(cargo_types):
-            new_cargo_types_result = await CargoTypeHandler.create_many(
-                session,
-                [
-                    {"name": name}
-                    for name in cargo_types
-                    if name not in [res.name for res in cargo_types_result]
-                ],
+        types_result = await session.execute(
+            pg_insert(CargoType)
+            .from_select(
+                ["name"],
+                select(staging.c.cargo_type)
+                .distinct()
+                .order_by(staging.c.cargo_type),
             )
-            cargo_types_result.extend(new_cargo_types_result)
-        cargo_types = dict(map(lambda r: (r.name, r), cargo_types_result))
+            .on_conflict_do_nothing()
+        )
+
+        # the last row wins when a (cargo_type, dt) pair repeats
+        latest = (
+            select(
+                CargoType.id.label("cargo_type_id"),
+                staging.c.dt,
+                staging.c.rate,
+                func.now().label("modified_at"),
+            )
+            .join(CargoType, CargoType.name == staging.c.cargo_type)
+            .distinct(CargoType.id, staging.c.dt)
+            .order_by(CargoType.id, staging.c.dt, staging.c.n.desc())
+            .cte("latest")
+        )
+        stmt = pg_insert(CargoRate).from_select(
+            ["cargo_type_id", "dt", "rate", "modified_at"], select(latest)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CargoRate.cargo_type_id, CargoRate.dt],
+            set_={
+                "rate": stmt.excluded.rate,
+                "modified_at": stmt.excluded.modified_at,
+            },
+            where=CargoRate.rate.is_distinct_from(stmt.excluded.rate),
+        )
+        upserted = stmt.returning(INSERTED).cte("upserted")
+        counts = (
+            await session.execute(
+                select(
+                    select(func.count())
+                    .select_from(latest)
+                    .scalar_subquery()
+                    .label("rates"),
+                    func.count().filter(upserted.c.inserted).label("inserted"),
+                    func.count().label("changed"),
+                ).select_from(upserted)
+            )
+        ).one()
 
-        for obj in objects:
-            cargo_type_name = obj.pop("cargo_type")
-            obj["cargo_type_id"] = cargo_types[cargo_type_name].id
+        if counts.changed:
+            await notify_rates_changed(session)
+        await session.commit()
+        if counts.changed:
+            invalidate_rates()
 
-        return await cls.upsert_many(session, ("cargo_type_id", "dt"), objects)
+        return ImportRatesResult(
+            rows=int(status.split()[-1]),
+            cargo_types_created=types_result.rowcount,
+            rates_inserted=counts.inserted,
+            rates_updated=counts.changed - counts.inserted,
+            rates_unchanged=counts.rates - counts.changed,
+            elapsed=time.perf_counter() - started,
+        )
 
     @classmethod
     async def delete_rates(
@@ -95,19 +588,22 @@ class CargoRateHandler(BaseHandler[CargoRate]):
             filters.append(cls.model.dt == dt)
 
         if cargo_type := data.cargo_type:
-            type_stmt = await CargoTypeHandler.get_by(
-                session, name=cargo_type, only_stmt=True
-            )
-            filters.append(
-                CargoRate.cargo_type_id.in_(
-                    type_stmt.with_only_columns(CargoType.id)
-                )
-            )
+            type_id = await CargoTypeHandler.get_id(session, cargo_type)
+            if type_id is None:
+                return
+            filters.append(cls.model.cargo_type_id == type_id)
 
-        stmt = (
+        # leave a tombstone per deleted rate for the change feed
+        deleted = (
             delete(cls.model)
             .filter(*filters)
-            .options(selectinload(CargoRate.cargo_type))
+            .returning(cls.model.id, cls.model.cargo_type_id, cls.model.dt)
+            .cte("deleted")
+        )
+        stmt = insert(CargoRateTombstone).from_select(
+            ["id", "cargo_type_id", "dt"], select(deleted)
         )
         await session.execute(stmt)
+        await notify_rates_changed(session)
         await session.commit()
+        invalidate_rates()
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import func, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import defer
+
+from app.config import settings
+from app.models import JobStatus, RateUploadJob
+from app.services.base.handler import BaseHandler
+from app.services.cargo.handler import CargoRateHandler
+from app.services.cargo.schemas import PostRatesSchema
+
+logger = logging.getLogger(__name__)
+
+
+class RateUploadJobHandler(BaseHandler[RateUploadJob]):
+    model = RateUploadJob
+
+    @classmethod
+    async def submit(
+        cls, session: AsyncSession, data: PostRatesSchema
+    ) -> RateUploadJob:
+        latest = CargoRateHandler.latest_rates(data)
+        rates = [
+            [cargo_type, dt.isoformat(), rate]
+            for (cargo_type, dt), rate in latest.items()
+        ]
+        return await cls.create(session, rates=rates, total=len(rates))
+
+    @classmethod
+    async def get_status(
+        cls, session: AsyncSession, job_id: int
+    ) -> Optional[RateUploadJob]:
+        # the uploaded rates can be megabytes and are never shown
+        return await session.get(
+            RateUploadJob, job_id, options=[defer(RateUploadJob.rates)]
+        )
+
+    @classmethod
+    async def claim(cls, session: AsyncSession) -> Optional[RateUploadJob]:
+        # SKIP LOCKED: workers of every process race for the same queue
+        pending = (
+            select(RateUploadJob.id)
+            # inlined, a bound parameter can't match the partial index
+            .filter(
+                RateUploadJob.status
+                == literal(JobStatus.PENDING.value, literal_execute=True)
+            )
+            .order_by(RateUploadJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(RateUploadJob)
+            .where(RateUploadJob.id == pending)
+            .values(status=JobStatus.RUNNING)
+            .returning(RateUploadJob)
+        )
+        job = await session.scalar(
+            stmt, execution_options={"synchronize_session": False}
+        )
+        await session.commit()
+        return job
+
+    @classmethod
+    async def requeue_stale(
+        cls, session: AsyncSession, stale_after: float
+    ) -> int:
+        # left running by a process that died halfway through
+        result = await session.execute(
+            update(RateUploadJob)
+            .filter_by(status=JobStatus.RUNNING)
+            .filter(
+                RateUploadJob.updated_at
+                < func.now() - timedelta(seconds=stale_after)
+            )
+            .values(status=JobStatus.PENDING)
+        )
+        await session.commit()
+        return result.rowcount
+
+    @classmethod
+    async def run_chunk(
+        cls, session: AsyncSession, job: RateUploadJob, chunk_size: int
+    ) -> None:
+        chunk = job.rates[job.processed : job.processed + chunk_size]
+        result = await CargoRateHandler.upsert_rates(
+            session,
+            {
+                (cargo_type, date.fromisoformat(dt)): rate
+                for cargo_type, dt, rate in chunk
+            },
+        )
+
+        # a chunk redone after a crash just comes back unchanged
+        job.processed += len(chunk)
+        job.inserted += result.inserted
+        job.updated += result.updated
+        job.unchanged += result.unchanged
+        if job.processed >= job.total:
+            job.status = JobStatus.DONE
+            job.rates = []
+        session.add(job)
+        await session.commit()
+
+    @classmethod
+    async def set_status(
+        cls,
+        session: AsyncSession,
+        job: RateUploadJob,
+        status: JobStatus,
+        error: Optional[str] = None,
+    ) -> None:
+        await session.rollback()
+        job.status = status
+        job.error = error
+        session.add(job)
+        await session.commit()
+
+
+class RateJobRunner:
+    """Runs rate-upload jobs in the background, a chunk per transaction,
+    with at most `workers` jobs at a time in this process."""
+
+    def __init__(
+        self,
+        workers: int = 1,
+        chunk_size: int = 5000,
+        poll_interval: float = 5.0,
+        stale_after: float = 300,
+    ):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+
+        self.sessionmaker: Optional[async_sessionmaker] = None
+        self.requeue_at = 0.0
+        self.wakeup = asyncio.Event()
+        self.running = False
+        self.tasks: list[asyncio.Task] = []
+
+    async def start(self, sessionmaker: async_sessionmaker) -> None:
+        self.sessionmaker = sessionmaker
+        await self._requeue_stale()
+
+        self.running = True
+        self.tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def dispose(self) -> None:
+        # workers finish their current chunk and hand the job back
+        self.running = False
+        self.wakeup.set()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def notify(self) -> None:
+        self.wakeup.set()
+
+    async def _worker(self) -> None:
+        while self.running:
+            try:
+                await self._requeue_stale()
+                found = await self._run_next()
+            except Exception:
+                logger.exception("Rate upload job runner failed")
+                found = False
+
+            if not found and self.running:
+                try:
+                    await asyncio.wait_for(
+                        self.wakeup.wait(), self.poll_interval
+                    )
+                except TimeoutError:
+                    pass
+                self.wakeup.clear()
+
+    async def _requeue_stale(self) -> None:
+        # not only on startup: a worker respawned right after another one
+        # died sees its job still fresh, so it's requeued later on
+        now = time.monotonic()
+        if now < self.requeue_at:
+            return
+        self.requeue_at = now + self.stale_after / 2
+
+        async with self.sessionmaker() as session:
+            if requeued := await RateUploadJobHandler.requeue_stale(
+                session, self.stale_after
+            ):
+                logger.warning("Requeued %d stale rate upload jobs", requeued)
+
+    async def _run_next(self) -> bool:
+        async with self.sessionmaker() as session:
+            job = await RateUploadJobHandler.claim(session)
+            if job is None:
+                return False
+
+            try:
+                while job.status == JobStatus.RUNNING:
+                    if not self.running:
+                        await RateUploadJobHandler.set_status(
+                            session, job, JobStatus.PENDING
+                        )
+                        break
+                    await RateUploadJobHandler.run_chunk(
+                        session, job, self.chunk_size
+                    )
+            except Exception as exc:
+                logger.exception("Rate upload job %d failed", job.id)
+                await RateUploadJobHandler.set_status(
+                    session, job, JobStatus.FAILED, str(exc)
+                )
+            return True
+
+
+rate_jobs = RateJobRunner(
+    workers=settings.jobs.workers,
+    chunk_size=settings.jobs.chunk_size,
+    poll_interval=settings.jobs.poll_interval,
+    stale_after=settings.jobs.stale_after,
+)
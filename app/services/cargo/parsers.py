@@ -0,0 +1,77 @@
+import csv
+import math
+from datetime import date
+from typing import AsyncIterable, AsyncIterator
+
+import orjson
+
+RateRow = tuple[str, date, float]
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    tail = b""
+    async for chunk in chunks:
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8")
+    if tail.strip():
+        yield tail.decode("utf-8")
+
+
+def _row(lineno: int, cargo_type, dt, rate) -> RateRow:
+    # null or a number is no cargo type, nor is a boolean, nan or inf a rate
+    try:
+        if not isinstance(cargo_type, str) or not cargo_type.strip():
+            raise ValueError("cargo_type must be a non-empty string")
+        if isinstance(rate, bool):
+            raise ValueError("rate must be a number")
+        rate = float(rate)
+        if not math.isfinite(rate):
+            raise ValueError("rate must be finite")
+        return cargo_type, date.fromisoformat(dt), rate
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"Invalid record {lineno}: {exc}") from exc
+
+
+async def parse_csv(chunks: AsyncIterable[bytes]) -> AsyncIterator[RateRow]:
+    lineno, columns = 0, None
+    async for line in iter_lines(chunks):
+        lineno += 1
+        values = next(csv.reader((line,)))
+        if columns is None:
+            columns = {name.strip(): i for i, name in enumerate(values)}
+            if not {"cargo_type", "dt", "rate"} <= columns.keys():
+                raise ValueError(
+                    "CSV header must contain cargo_type, dt and rate."
+                )
+            continue
+        try:
+            yield _row(
+                lineno,
+                values[columns["cargo_type"]],
+                values[columns["dt"]],
+                values[columns["rate"]],
+            )
+        except IndexError:
+            raise ValueError(f"Invalid record {lineno}.")
+
+
+async def parse_ndjson(
+    chunks: AsyncIterable[bytes],
+) -> AsyncIterator[RateRow]:
+    lineno = 0
+    async for line in iter_lines(chunks):
+        lineno += 1
+        try:
+            obj = orjson.loads(line)
+            yield _row(lineno, obj["cargo_type"], obj["dt"], obj["rate"])
+        except (orjson.JSONDecodeError, KeyError, TypeError) as exc:
+            raise ValueError(f"Invalid record {lineno}: {exc}") from exc
+
+
+PARSERS = {
+    "text/csv": parse_csv,
+    "application/x-ndjson": parse_ndjson,
+}
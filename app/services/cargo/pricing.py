@@ -0,0 +1,17 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+
+
+def premium(price: int, rate: float) -> float:
+    """`price * rate` rounded half up to cents, ValueError if it can't be
+    (a non-finite rate, or more digits than the decimal context holds)."""
+    # str() is the shortest repr, so a stored 0.07 multiplies as 0.07
+    # rather than as 0.0700000000000000066613381477509392...
+    try:
+        insurance = (price * Decimal(str(rate))).quantize(CENT, ROUND_HALF_UP)
+    except InvalidOperation as exc:
+        raise ValueError("Insurance is out of range.") from exc
+    if not insurance.is_finite():
+        raise ValueError("Insurance is out of range.")
+    return float(insurance)
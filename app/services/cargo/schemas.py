@@ -1,6 +1,9 @@
-from datetime import date
+from datetime import date, datetime
 
-from pydantic import RootModel, BaseModel
+from pydantic import RootModel, BaseModel, ConfigDict, Field
+
+# keeps price * rate within the 28 digits premiums are computed with
+MAX_PRICE = 10**15
 
 
 class CargoType(BaseModel):
@@ -11,16 +14,77 @@ class CargoType(BaseModel):
 class CargoRate(BaseModel):
     cargo_type: CargoType
     rate: float
+    dt: date
 
 
 class CargoRateIn(CargoRate):
     cargo_type: str
+    rate: float = Field(allow_inf_nan=False)
     dt: date | None = None
 
 
 class PostRatesSchema(RootModel[dict[date, list[CargoRateIn]]]): ...
 
 
+class UpsertRatesResult(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+
+
+class RateUploadJobOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    status: str
+    total: int
+    processed: int
+    inserted: int
+    updated: int
+    unchanged: int
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
+
+
+class ImportRatesResult(BaseModel):
+    rows: int
+    cargo_types_created: int
+    rates_inserted: int
+    rates_updated: int
+    rates_unchanged: int
+    elapsed: float
+
+
+class RateChange(BaseModel):
+    cargo_type: str
+    dt: date
+    rate: float | None
+    deleted: bool
+    modified_at: datetime
+
+
+class RateChangesPage(BaseModel):
+    changes: list[RateChange]
+    cursor: str | None
+    has_more: bool
+
+
 class DeleteRatesSchema(BaseModel):
     cargo_type: str | None = None
     dt: date | None = None
+
+
+class InsuranceItemIn(BaseModel):
+    cargo_type: str
+    price: int = Field(ge=0, le=MAX_PRICE)
+    dt: date = Field(default_factory=date.today)
+
+
+class InsuranceItemOut(BaseModel):
+    insurance: float | None = None
+    error: str | None = None
+
+
+class InsuranceBatchSchema(RootModel[list[InsuranceItemIn]]):
+    root: list[InsuranceItemIn] = Field(..., max_length=10000)
@@ -0,0 +1,22 @@
+import base64
+from typing import Any
+
+import orjson
+from pydantic import TypeAdapter, ValidationError
+
+
+def encode_cursor(*values: Any) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(values)).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError
+        return tuple(
+            TypeAdapter(type_).validate_python(value)
+            for type_, value in zip(types, values)
+        )
+    except (ValueError, ValidationError, UnicodeError):
+        raise ValueError("Invalid cursor")
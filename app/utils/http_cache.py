@@ -0,0 +1,60 @@
+import hashlib
+from datetime import datetime, UTC
+from typing import Optional
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def cache_headers(etag: str, modified_at: datetime, max_age: int) -> dict:
+    if modified_at.tzinfo is None:
+        modified_at = modified_at.replace(tzinfo=UTC)
+    return {
+        "ETag": etag,
+        "Last-Modified": format_datetime(modified_at, usegmt=True),
+        "Cache-Control": f"public, max-age={max_age}",
+    }
+
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    """An HTTP-date header as an aware datetime, None if it's invalid.
+
+    The asctime form and a -0000 zone parse naive, but are GMT too:
+
+    >>> parse_http_date("Sun Nov  6 08:49:37 1994")
+    datetime.datetime(1994, 11, 6, 8, 49, 37, tzinfo=datetime.timezone.utc)
+    >>> parse_http_date("Sun, 06 Nov 1994 08:49:37 -0000").tzinfo
+    datetime.timezone.utc
+    >>> parse_http_date("yesterday") is None
+    True
+    """
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+    if if_none_match := request.headers.get("If-None-Match"):
+        # weak comparison, proxies that gzip send the tag back as W/"..."
+        tags = {
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        }
+        return "*" in tags or headers["ETag"] in tags
+
+    if if_modified_since := request.headers.get("If-Modified-Since"):
+        since = parse_http_date(if_modified_since)
+        if since is None:
+            return False
+        return parse_http_date(headers["Last-Modified"]) <= since
+
+    return False
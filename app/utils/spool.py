@@ -0,0 +1,101 @@
+import fcntl
+import os
+import time
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Spool:
+    """Append-only on-disk queue of newline-delimited records.
+
+    Records are appended to `<time_ns>-<pid>.log` segments that are rotated
+    once they grow past `segment_size`. The open segment is `flock`-ed by
+    its writer, so several processes can share one directory: a sealed or
+    orphaned segment is claimed for replay by renaming it to
+    `*.<pid>.replay`, and whoever wins the rename owns it.
+    """
+
+    def __init__(self, path: str, segment_size: int = 16 * 1024 * 1024):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.pid = os.getpid()
+
+        self._file: Optional[BinaryIO] = None
+        self._size = 0
+        self._recover()
+
+    @property
+    def pending(self) -> bool:
+        """Whether records appended by this process are still on disk."""
+        return self._file is not None or any(
+            self.path.glob(f"*-{self.pid}.log")
+        )
+
+    def append(self, record: bytes) -> None:
+        if self._file is None or self._size >= self.segment_size:
+            self._rotate()
+        self._file.write(record + b"\n")
+        self._size += len(record) + 1
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def seal(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._size = 0
+
+    def claim(self) -> Optional[Path]:
+        for segment in sorted(self.path.glob("*.log")):
+            try:
+                with open(segment, "rb") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    claimed = segment.with_suffix(f".{self.pid}.replay")
+                    os.rename(segment, claimed)
+                    return claimed
+            except (BlockingIOError, FileNotFoundError):
+                continue
+        return None
+
+    def read(self, segment: Path) -> list[bytes]:
+        with open(segment, "rb") as f:
+            return [line.rstrip(b"\n") for line in f if line.strip()]
+
+    def release(self, segment: Path) -> None:
+        os.rename(segment, segment.with_suffix("").with_suffix(".log"))
+
+    def remove(self, segment: Path) -> None:
+        segment.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self.flush()
+        self.seal()
+
+    def _rotate(self) -> None:
+        self.seal()
+        name = f"{time.time_ns():020d}-{self.pid}"
+        tmp = self.path / f"{name}.tmp"
+        self._file = open(tmp, "ab")
+        # locked before it becomes visible to `claim`
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        os.rename(tmp, self.path / f"{name}.log")
+
+    def _recover(self) -> None:
+        # segments claimed by a process that died mid-replay
+        for segment in self.path.glob("*.replay"):
+            owner = int(segment.suffixes[-2].lstrip("."))
+            if owner != self.pid and not _is_alive(owner):
+                self.release(segment)
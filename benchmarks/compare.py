@@ -0,0 +1,74 @@
+"""Compare two load test results and flag regressions.
+
+    python -m benchmarks.compare benchmarks/results/abc123-quotes.json \\
+        benchmarks/results/def456-quotes.json --threshold 10
+
+Exits with status 1 when any endpoint's p95/p99 latency grew, or its
+throughput dropped, by more than the threshold (in percent).
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# metric -> whether a larger value is better
+METRICS = {
+    "rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "queries_per_request": False,
+}
+GATED = ("rps", "p95_ms", "p99_ms", "queries_per_request")
+
+
+def change(before: float, after: float) -> float:
+    if not before:
+        return 0.0 if not after else float("inf")
+    return (after - before) / before * 100
+
+
+def compare(before: dict, after: dict, threshold: float) -> list[str]:
+    regressions = []
+    rows = [("total", before["total"], after["total"])] + [
+        (kind, before["endpoints"][kind], after["endpoints"][kind])
+        for kind in sorted(before["endpoints"])
+        if kind in after["endpoints"]
+    ]
+
+    print(f"{before['commit']} -> {after['commit']} ({after['mix']})")
+    for name, old, new in rows:
+        for metric, higher_is_better in METRICS.items():
+            if metric not in old or metric not in new:
+                continue
+            delta = change(old[metric], new[metric])
+            worse = -delta if higher_is_better else delta
+            flag = ""
+            if metric in GATED and worse > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}.{metric}")
+            print(
+                f"  {name:<16} {metric:<20}"
+                f" {old[metric]:>10.2f} -> {new[metric]:>10.2f}"
+                f" ({delta:+.1f}%){flag}"
+            )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--threshold", type=float, default=10)
+    args = parser.parse_args()
+
+    regressions = compare(
+        json.loads(args.before.read_text()),
+        json.loads(args.after.read_text()),
+        args.threshold,
+    )
+    sys.exit(1 if regressions else 0)
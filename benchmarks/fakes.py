@@ -0,0 +1,24 @@
+import asyncio
+
+
+class FakeProducer:
+    """In-memory stand-in for `AIOKafkaProducer` used by `AppBroker`."""
+
+    def __init__(self, keep: int = 1000) -> None:
+        self.keep = keep
+        self.sent = 0
+        self.messages: list[bytes] = []
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def send(self, topic: str, value: bytes) -> asyncio.Future:
+        self.sent += 1
+        if len(self.messages) < self.keep:
+            self.messages.append(value)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
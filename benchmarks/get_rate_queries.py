@@ -0,0 +1,96 @@
+"""Queries and latency per `get_rate` call: subquery lookup vs single JOIN.
+
+Runs against the database configured in `.env` (tables must be migrated),
+seeding a throwaway cargo type in a transaction that is rolled back::
+
+    python -m benchmarks.get_rate_queries --iterations 1000
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import date
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.database import db_helper
+from app.models import CargoRate, CargoType
+from app.services.cargo.cache import invalidate_rates
+from app.services.cargo.handler import CargoRateHandler
+
+
+async def subquery_get_rate(session: AsyncSession, cargo_type: str, dt: date):
+    type_ids = select(CargoType.id).filter_by(name=cargo_type)
+    stmt = (
+        select(CargoRate)
+        .filter(CargoRate.cargo_type_id.in_(type_ids))
+        .filter_by(dt=dt)
+        .options(selectinload(CargoRate.cargo_type))
+    )
+    return (await session.scalars(stmt)).one_or_none()
+
+
+async def join_get_rate(session: AsyncSession, cargo_type: str, dt: date):
+    invalidate_rates()
+    return await CargoRateHandler.get_rate(session, cargo_type, dt)
+
+
+async def measure(session, fn, cargo_type, dt, iterations) -> dict:
+    queries = 0
+
+    def count(*_):
+        nonlocal queries
+        queries += 1
+
+    engine = db_helper.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            assert await fn(session, cargo_type, dt) is not None
+            # every request gets a fresh session in the API
+            session.expunge_all()
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    return {
+        "queries_per_request": queries / iterations,
+        "mean_ms": elapsed / iterations * 1000,
+    }
+
+
+async def main(iterations: int) -> None:
+    dt = date.today()
+    cargo_type = f"bench-{uuid.uuid4().hex[:8]}"
+
+    async with db_helper.sessionmaker() as session:
+        obj = CargoType(name=cargo_type)
+        session.add(obj)
+        await session.flush()
+        session.add(CargoRate(cargo_type_id=obj.id, dt=dt, rate=0.05))
+        await session.flush()
+
+        for name, fn in (
+            ("subquery", subquery_get_rate),
+            ("join", join_get_rate),
+        ):
+            result = await measure(session, fn, cargo_type, dt, iterations)
+            print(
+                f"{name:<10}"
+                f" queries/request={result['queries_per_request']:.2f}"
+                f" mean={result['mean_ms']:.3f}ms"
+            )
+
+        await session.rollback()
+
+    await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1000)
+    asyncio.run(main(parser.parse_args().iterations))
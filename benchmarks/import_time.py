@@ -0,0 +1,76 @@
+"""Time to import the application and to build it, in fresh interpreters.
+
+With `gunicorn --preload` this is paid once in the master instead of in
+every worker; connections are opened per worker in the lifespan::
+
+    python -m benchmarks.import_time --runs 10
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """
+import time
+started = time.perf_counter()
+import app.api.http_server as module
+imported = time.perf_counter()
+app = module.create_app() if hasattr(module, "create_app") else None
+created = time.perf_counter()
+from app.database import db_helper
+state = vars(db_helper)
+engines = state.get("_engine", state.get("engine")) is not None
+print(imported - started, created - imported, engines)
+"""
+
+
+def measure() -> tuple[float, float, bool]:
+    output = subprocess.run(
+        [sys.executable, "-c", SNIPPET],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    return float(output[0]), float(output[1]), output[2] == "True"
+
+
+def slowest_imports(limit: int) -> list[tuple[int, str]]:
+    # -X importtime reports cumulative microseconds per module on stderr
+    stderr = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import app.api.http_server",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    imported = statistics.median(run[0] for run in runs)
+    created = statistics.median(run[1] for run in runs)
+    print(
+        f"import {imported * 1e3:.1f}ms, create_app {created * 1e3:.1f}ms"
+        f" (median of {args.runs}), engine created at import: {runs[0][2]}"
+    )
+    for cumulative, name in slowest_imports(args.top):
+        print(f"{cumulative / 1e3:8.1f}ms  {name}")
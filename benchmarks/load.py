@@ -0,0 +1,309 @@
+"""Load test for the cargo API with a realistic traffic mix.
+
+In-process, through an ASGI client against a throwaway database created on
+the configured Postgres server (dropped afterwards) and a fake Kafka
+producer::
+
+    python -m benchmarks.load --mix quotes --duration 30 --concurrency 32
+
+Against a running deployment, e.g. gunicorn started with `make run`. Note
+that this seeds and modifies `bench-*` cargo types in its database::
+
+    python -m benchmarks.load --url http://localhost:8000 --duration 30
+
+Results are written to `benchmarks/results/<commit>-<mix>.json`, compare
+two runs with `python -m benchmarks.compare`.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import asyncpg
+import httpx
+
+from benchmarks.fakes import FakeProducer
+
+RESULTS_DIR = Path(__file__).parent / "results"
+PREFIX = "/api/v1/cargo"
+
+# relative weights of each request kind
+MIXES = {
+    "quotes": {
+        "rates": 45,
+        "insurance": 45,
+        "insurance_batch": 8,
+        "post_rates": 1.5,
+        "delete_rates": 0.5,
+    },
+    "uploads": {
+        "rates": 30,
+        "insurance": 30,
+        "insurance_batch": 10,
+        "post_rates": 25,
+        "delete_rates": 5,
+    },
+}
+
+current_kind = contextvars.ContextVar("current_kind", default=None)
+
+
+class Dataset:
+    def __init__(self, cargo_types: int, days: int, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.cargo_types = [f"bench-{i}" for i in range(cargo_types)]
+        self.days = [date.today() - timedelta(days=i) for i in range(days)]
+
+    def rates(self, dt: date) -> list[dict]:
+        return [
+            {"cargo_type": name, "rate": round(self.rng.uniform(0.01, 0.1), 4)}
+            for name in self.cargo_types
+        ]
+
+    def request(self, kind: str) -> tuple[str, str, dict]:
+        cargo_type = self.rng.choice(self.cargo_types)
+        dt = self.rng.choice(self.days)
+        price = self.rng.randint(100, 1_000_000)
+
+        if kind == "rates":
+            url = f"{PREFIX}/{cargo_type}/rates"
+            return "GET", url, {"params": {"dt": dt.isoformat()}}
+        if kind == "insurance":
+            url = f"{PREFIX}/{cargo_type}/insurance"
+            params = {"dt": dt.isoformat(), "price": price}
+            return "GET", url, {"params": params}
+        if kind == "insurance_batch":
+            items = [
+                {
+                    "cargo_type": self.rng.choice(self.cargo_types),
+                    "dt": self.rng.choice(self.days).isoformat(),
+                    "price": self.rng.randint(100, 1_000_000),
+                }
+                for _ in range(50)
+            ]
+            return "POST", f"{PREFIX}/insurance", {"json": items}
+        if kind == "post_rates":
+            body = {dt.isoformat(): self.rates(dt)}
+            return "POST", f"{PREFIX}/rates", {"json": body}
+        if kind == "delete_rates":
+            body = {"cargo_type": cargo_type, "dt": dt.isoformat()}
+            return "DELETE", f"{PREFIX}/rates", {"json": body}
+        raise ValueError(f"Unknown request kind: {kind}")
+
+
+@asynccontextmanager
+async def throwaway_database() -> AsyncIterator[str]:
+    from app.config import settings
+
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    admin_dsn = (
+        f"postgresql://{settings.db.user}:{settings.db.password}"
+        f"@{settings.db.host}:{settings.db.port}/postgres"
+    )
+
+    conn = await asyncpg.connect(admin_dsn)
+    await conn.execute(f'CREATE DATABASE "{name}"')
+    await conn.close()
+    try:
+        subprocess.run(
+            [sys.executable, "-m", "alembic", "upgrade", "head"],
+            env={**os.environ, "APP__DB__NAME": name},
+            check=True,
+        )
+        yield name
+    finally:
+        conn = await asyncpg.connect(admin_dsn)
+        await conn.execute(f'DROP DATABASE "{name}" WITH (FORCE)')
+        await conn.close()
+
+
+@asynccontextmanager
+async def in_process_client(
+    queries: Counter,
+) -> AsyncIterator[httpx.AsyncClient]:
+    async with throwaway_database() as name:
+        from sqlalchemy import event
+
+        from app.api.http_server import create_app
+        from app.broker import app_broker
+        from app.config import settings
+        from app.database import db_helper
+
+        # engines are created on first use, so this still takes effect
+        settings.db.name = name
+        db_helper.db_url = settings.db.url
+        db_helper.listen_url = settings.db.listen_url
+        application = create_app()
+
+        app_broker.producer = FakeProducer()
+
+        def count(*_):
+            queries[current_kind.get()] += 1
+
+        event.listen(
+            db_helper.engine.sync_engine, "before_cursor_execute", count
+        )
+
+        transport = httpx.ASGITransport(app=application)
+        async with application.router.lifespan_context(application):
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench"
+            ) as client:
+                yield client
+
+
+def summarize(latencies: list[float], duration: float) -> dict:
+    if len(latencies) < 2:
+        latencies = latencies * 2 or [0.0, 0.0]
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "count": len(latencies),
+        "rps": len(latencies) / duration,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+async def run(
+    client: httpx.AsyncClient,
+    dataset: Dataset,
+    mix: dict[str, float],
+    duration: float,
+    concurrency: int,
+) -> tuple[dict, dict, float]:
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    kinds, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            kind = dataset.rng.choices(kinds, weights)[0]
+            method, url, kw = dataset.request(kind)
+            token = current_kind.set(kind)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kw)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            finally:
+                current_kind.reset(token)
+            latencies[kind].append(time.perf_counter() - started)
+            statuses[kind][status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def seed(client: httpx.AsyncClient, dataset: Dataset) -> None:
+    body = {dt.isoformat(): dataset.rates(dt) for dt in dataset.days}
+    response = await client.post(f"{PREFIX}/rates", json=body)
+    response.raise_for_status()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args: argparse.Namespace) -> dict:
+    dataset = Dataset(args.cargo_types, args.days, args.seed)
+    queries = Counter()
+
+    if args.url:
+        client_cm = httpx.AsyncClient(
+            base_url=args.url,
+            limits=httpx.Limits(max_connections=args.concurrency),
+        )
+    else:
+        client_cm = in_process_client(queries)
+
+    async with client_cm as client:
+        await seed(client, dataset)
+        queries.clear()
+        await run(client, dataset, MIXES[args.mix], args.warmup, 4)
+        queries.clear()
+        latencies, statuses, elapsed = await run(
+            client, dataset, MIXES[args.mix], args.duration, args.concurrency
+        )
+
+    endpoints = {}
+    for kind, values in latencies.items():
+        endpoints[kind] = summarize(values, elapsed)
+        endpoints[kind]["statuses"] = {
+            str(code): n for code, n in statuses[kind].items()
+        }
+        if not args.url:
+            endpoints[kind]["queries_per_request"] = queries[kind] / len(
+                values
+            )
+
+    everything = [v for values in latencies.values() for v in values]
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now().isoformat(),
+        "target": args.url or "asgi",
+        "mix": args.mix,
+        "duration": elapsed,
+        "concurrency": args.concurrency,
+        "total": summarize(everything, elapsed),
+        "errors": sum(
+            n
+            for counter in statuses.values()
+            for code, n in counter.items()
+            if code == "error" or code >= 500
+        ),
+        "endpoints": endpoints,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--url", help="benchmark a running deployment")
+    parser.add_argument("--mix", choices=MIXES, default="quotes")
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--cargo-types", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+
+    output = args.output or RESULTS_DIR / f"{report['commit']}-{args.mix}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    total = report["total"]
+    print(
+        f"{report['target']} {args.mix}: {total['rps']:.0f} req/s,"
+        f" p50={total['p50_ms']:.2f}ms p95={total['p95_ms']:.2f}ms"
+        f" p99={total['p99_ms']:.2f}ms, errors={report['errors']}"
+    )
+    print(f"Saved to {output}")
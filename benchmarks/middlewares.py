@@ -0,0 +1,108 @@
+"""Requests/sec through the middleware stack: BaseHTTPMiddleware vs ASGI.
+
+Drives the ASGI app directly, without a server, so the numbers only
+reflect the middleware layers::
+
+    python -m benchmarks.middlewares --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.middleware import Middleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.api.middlewares.kafka_logger import KafkaLoggerMiddleware
+from app.api.middlewares.user_id import UserIDMiddleware
+from app.broker import app_broker, KafkaMessage
+
+
+class LegacyUserIDMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request.state.user_id = request.headers.get("X-User-Id")
+        return await call_next(request)
+
+
+class LegacyKafkaLoggerMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        if 200 <= response.status_code < 300:
+            if kafka_action := getattr(request.state, "kafka_action", None):
+                user_id = getattr(request.state, "user_id", None)
+                await app_broker.publish(
+                    KafkaMessage(user_id=user_id, action=kafka_action)
+                )
+        return response
+
+
+def make_app(user_id_middleware, kafka_middleware) -> FastAPI:
+    app = FastAPI(
+        middleware=[
+            Middleware(GZipMiddleware, minimum_size=1000),
+            Middleware(user_id_middleware),
+            Middleware(kafka_middleware),
+        ]
+    )
+
+    @app.get("/ping")
+    async def ping(request: Request) -> dict:
+        request.state.kafka_action = "ping"
+        return {"user_id": request.state.user_id}
+
+    return app
+
+
+async def run(app: FastAPI, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/ping",
+        "raw_path": b"/ping",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"x-user-id", b"42"), (b"accept-encoding", b"gzip")],
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return requests / (time.perf_counter() - started)
+
+
+async def main(requests: int) -> None:
+    # keep the broker itself out of the measurement
+    app_broker.publish = _discard
+
+    for name, app in (
+        (
+            "base_http",
+            make_app(LegacyUserIDMiddleware, LegacyKafkaLoggerMiddleware),
+        ),
+        ("asgi", make_app(UserIDMiddleware, KafkaLoggerMiddleware)),
+    ):
+        await run(app, requests // 10)
+        print(f"{name:<10} {await run(app, requests):>10.0f} req/s")
+
+
+async def _discard(message: KafkaMessage) -> None:
+    pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    asyncio.run(main(parser.parse_args().requests))
@@ -0,0 +1,113 @@
+"""CPU per rate response: response-model validation vs pre-encoded bytes.
+
+Serves the same ORM rate from two otherwise identical routes, one
+returning the object through the `CargoRate` response model (the former
+`get_rate`), one returning `CargoRateHandler.rate_json()`. Drives the ASGI
+app directly, without a server or database::
+
+    python -m benchmarks.serialization --requests 20000
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
+
+from app.models import CargoRate, CargoType
+from app.services.cargo.handler import CargoRateHandler
+from app.services.cargo.schemas import CargoRate as CargoRateSchema
+
+
+def make_rate() -> CargoRate:
+    rate = CargoRate(
+        id=1,
+        rate=0.07,
+        dt=date(2024, 11, 19),
+        cargo_type_id=1,
+        modified_at=datetime(2024, 11, 19, 12),
+    )
+    rate.cargo_type = CargoType(id=1, name="Glass")
+    return rate
+
+
+def make_app(rate: CargoRate) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    @app.get("/validated")
+    async def validated() -> Optional[CargoRateSchema]:
+        return rate
+
+    @app.get("/encoded")
+    async def encoded() -> Optional[CargoRateSchema]:
+        return Response(
+            CargoRateHandler.rate_json(rate), media_type="application/json"
+        )
+
+    return app
+
+
+async def run(app: FastAPI, path: str, requests: int) -> tuple[float, bytes]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [],
+        "client": ("127.0.0.1", 1),
+        "server": ("127.0.0.1", 80),
+    }
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message["body"])
+
+    started = time.process_time()
+    for _ in range(requests):
+        body.clear()
+        await app(scope, receive, send)
+    return time.process_time() - started, b"".join(body)
+
+
+async def main(requests: int) -> None:
+    rate = make_rate()
+    app = make_app(rate)
+
+    # warm up routing, response model fields and the bodies cache
+    for path in ("/validated", "/encoded"):
+        await run(app, path, 100)
+
+    results = {}
+    for path in ("/validated", "/encoded"):
+        cpu, body = await run(app, path, requests)
+        results[path] = cpu
+        print(
+            f"{path:<11} {cpu / requests * 1e6:7.1f} us CPU/request,"
+            f" {requests / cpu:8.0f} req/s per core  {body.decode()}"
+        )
+
+    saved = 1 - results["/encoded"] / results["/validated"]
+    print(f"pre-encoded bodies save {saved:.0%} CPU per request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests))
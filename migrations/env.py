@@ -1,4 +1,5 @@
 import asyncio
+import re
 from logging.config import fileConfig
 
 from sqlalchemy import pool
@@ -33,6 +34,14 @@ target_metadata = Base.metadata
 config.set_main_option("sqlalchemy.url", settings.db.url)
 
 
+def include_name(name, type_, parent_names) -> bool:
+    # partitions are managed by `python -m app.commands.partitions`
+    return not (
+        type_ == "table"
+        and re.fullmatch(r"cargo_rates_(y\d{4}|default)", name)
+    )
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -58,7 +67,11 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+    )
 
     with context.begin_transaction():
         context.run_migrations()
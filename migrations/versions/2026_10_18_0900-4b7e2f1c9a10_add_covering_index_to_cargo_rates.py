@@ -0,0 +1,31 @@
+"""add covering index to cargo_rates
+
+Revision ID: 4b7e2f1c9a10
+Revises: 999cf6d2695c
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "4b7e2f1c9a10"
+down_revision: Union[str, None] = "999cf6d2695c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_cargo_rates_cargo_type_id_dt",
+        "cargo_rates",
+        ["cargo_type_id", "dt"],
+        postgresql_include=["id", "rate"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_cargo_rates_cargo_type_id_dt", table_name="cargo_rates")
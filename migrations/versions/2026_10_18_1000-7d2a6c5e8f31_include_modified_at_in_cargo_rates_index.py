@@ -0,0 +1,38 @@
+"""include modified_at in cargo_rates covering index
+
+Revision ID: 7d2a6c5e8f31
+Revises: 4b7e2f1c9a10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7d2a6c5e8f31"
+down_revision: Union[str, None] = "4b7e2f1c9a10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index("ix_cargo_rates_cargo_type_id_dt", table_name="cargo_rates")
+    op.create_index(
+        "ix_cargo_rates_cargo_type_id_dt",
+        "cargo_rates",
+        ["cargo_type_id", "dt"],
+        postgresql_include=["id", "rate", "modified_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_cargo_rates_cargo_type_id_dt", table_name="cargo_rates")
+    op.create_index(
+        "ix_cargo_rates_cargo_type_id_dt",
+        "cargo_rates",
+        ["cargo_type_id", "dt"],
+        postgresql_include=["id", "rate"],
+    )
@@ -0,0 +1,58 @@
+"""add cargo_rates change feed index and tombstones
+
+Revision ID: a3c9e1d4b7f2
+Revises: 7d2a6c5e8f31
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a3c9e1d4b7f2"
+down_revision: Union[str, None] = "7d2a6c5e8f31"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_cargo_rates_modified_at_id",
+        "cargo_rates",
+        ["modified_at", "id"],
+    )
+    op.create_table(
+        "cargo_rate_tombstones",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("dt", sa.Date(), nullable=False),
+        sa.Column("cargo_type_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "deleted_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["cargo_type_id"],
+            ["cargo_types.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_cargo_rate_tombstones_deleted_at_id",
+        "cargo_rate_tombstones",
+        ["deleted_at", "id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_cargo_rate_tombstones_deleted_at_id",
+        table_name="cargo_rate_tombstones",
+    )
+    op.drop_table("cargo_rate_tombstones")
+    op.drop_index("ix_cargo_rates_modified_at_id", table_name="cargo_rates")
@@ -0,0 +1,142 @@
+"""partition cargo_rates by dt
+
+Revision ID: c5f8b2e7d190
+Revises: a3c9e1d4b7f2
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5f8b2e7d190"
+down_revision: Union[str, None] = "a3c9e1d4b7f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONSTRAINTS = ("pkey", "cargo_type_id_dt_key", "cargo_type_id_fkey")
+
+
+def rename(table: str, new_table: str) -> None:
+    op.rename_table(table, new_table)
+    for suffix in CONSTRAINTS:
+        op.execute(
+            f"ALTER TABLE {new_table} "
+            f"RENAME CONSTRAINT {table}_{suffix} TO {new_table}_{suffix}"
+        )
+
+
+def create_indexes() -> None:
+    op.create_index(
+        "ix_cargo_rates_cargo_type_id_dt",
+        "cargo_rates",
+        ["cargo_type_id", "dt"],
+        postgresql_include=["id", "rate", "modified_at"],
+    )
+    op.create_index(
+        "ix_cargo_rates_modified_at_id",
+        "cargo_rates",
+        ["modified_at", "id"],
+    )
+
+
+def drop_indexes() -> None:
+    op.drop_index("ix_cargo_rates_cargo_type_id_dt", table_name="cargo_rates")
+    op.drop_index("ix_cargo_rates_modified_at_id", table_name="cargo_rates")
+
+
+def create_cargo_rates(*args, **kw) -> None:
+    op.create_table(
+        "cargo_rates",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('cargo_rates_id_seq')"),
+            nullable=False,
+        ),
+        sa.Column("rate", sa.Float(), nullable=False),
+        sa.Column("dt", sa.Date(), nullable=False),
+        sa.Column("cargo_type_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "modified_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["cargo_type_id"],
+            ["cargo_types.id"],
+        ),
+        sa.UniqueConstraint("cargo_type_id", "dt"),
+        *args,
+        **kw,
+    )
+
+
+def copy_rates(source: str) -> None:
+    op.execute(
+        "INSERT INTO cargo_rates (id, rate, dt, cargo_type_id, modified_at) "
+        f"SELECT id, rate, dt, cargo_type_id, modified_at FROM {source}"
+    )
+
+
+def upgrade() -> None:
+    drop_indexes()
+    rename("cargo_rates", "cargo_rates_unpartitioned")
+
+    create_cargo_rates(
+        sa.PrimaryKeyConstraint("id", "dt"),
+        postgresql_partition_by="RANGE (dt)",
+    )
+    create_indexes()
+
+    # a yearly partition for every year with data up to the next one,
+    # later years are created by `python -m app.commands.partitions`
+    op.execute(
+        """
+        DO $$
+        DECLARE
+            year int;
+        BEGIN
+            FOR year IN
+                SELECT generate_series(
+                    coalesce(
+                        (SELECT min(extract(year FROM dt))::int
+                         FROM cargo_rates_unpartitioned),
+                        extract(year FROM now())::int
+                    ),
+                    extract(year FROM now())::int + 1
+                )
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE cargo_rates_y%s PARTITION OF cargo_rates '
+                    'FOR VALUES FROM (%L) TO (%L)',
+                    year, make_date(year, 1, 1), make_date(year + 1, 1, 1)
+                );
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute(
+        "CREATE TABLE cargo_rates_default PARTITION OF cargo_rates DEFAULT"
+    )
+
+    copy_rates("cargo_rates_unpartitioned")
+    op.execute("ALTER SEQUENCE cargo_rates_id_seq OWNED BY cargo_rates.id")
+    op.drop_table("cargo_rates_unpartitioned")
+
+
+def downgrade() -> None:
+    drop_indexes()
+    rename("cargo_rates", "cargo_rates_partitioned")
+
+    create_cargo_rates(sa.PrimaryKeyConstraint("id"))
+    create_indexes()
+
+    copy_rates("cargo_rates_partitioned")
+    op.execute("ALTER SEQUENCE cargo_rates_id_seq OWNED BY cargo_rates.id")
+    op.drop_table("cargo_rates_partitioned")
@@ -0,0 +1,73 @@
+"""create rate_upload_jobs
+
+Revision ID: e2d4a6f8b1c3
+Revises: c5f8b2e7d190
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2d4a6f8b1c3"
+down_revision: Union[str, None] = "c5f8b2e7d190"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rate_upload_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "status", sa.String(), server_default="pending", nullable=False
+        ),
+        sa.Column(
+            "rates", postgresql.JSONB(astext_type=sa.Text()), nullable=False
+        ),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column(
+            "processed", sa.Integer(), server_default="0", nullable=False
+        ),
+        sa.Column(
+            "inserted", sa.Integer(), server_default="0", nullable=False
+        ),
+        sa.Column("updated", sa.Integer(), server_default="0", nullable=False),
+        sa.Column(
+            "unchanged", sa.Integer(), server_default="0", nullable=False
+        ),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_rate_upload_jobs_pending",
+        "rate_upload_jobs",
+        ["id"],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_rate_upload_jobs_pending",
+        table_name="rate_upload_jobs",
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    op.drop_table("rate_upload_jobs")
@@ -0,0 +1,45 @@
+"""cover cargo_rates unique constraint
+
+Revision ID: f1a3c5e7d9b2
+Revises: e2d4a6f8b1c3
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f1a3c5e7d9b2"
+down_revision: Union[str, None] = "e2d4a6f8b1c3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONSTRAINT = "cargo_rates_cargo_type_id_dt_key"
+INCLUDE = ["id", "rate", "modified_at"]
+
+
+def upgrade() -> None:
+    # one index for ON CONFLICT and index-only lookups instead of two
+    op.drop_index("ix_cargo_rates_cargo_type_id_dt", table_name="cargo_rates")
+    op.drop_constraint(CONSTRAINT, "cargo_rates", type_="unique")
+    # alembic's stand-in table only knows the key columns, not INCLUDE ones
+    op.execute(
+        f"ALTER TABLE cargo_rates ADD CONSTRAINT {CONSTRAINT} "
+        f"UNIQUE (cargo_type_id, dt) INCLUDE ({', '.join(INCLUDE)})"
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(CONSTRAINT, "cargo_rates", type_="unique")
+    op.create_unique_constraint(
+        CONSTRAINT, "cargo_rates", ["cargo_type_id", "dt"]
+    )
+    op.create_index(
+        "ix_cargo_rates_cargo_type_id_dt",
+        "cargo_rates",
+        ["cargo_type_id", "dt"],
+        postgresql_include=INCLUDE,
+    )